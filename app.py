@@ -1,250 +1,287 @@
+import cProfile
+import io
+import json
+import time
+
 import streamlit as st
 import pandas as pd
 
+import matching
+import perf
+from matching import (
+    BONUS_CAP, EXPORT_FORMATS, REASON_THEMES, SCALAR_HELPERS, THEME_WEIGHTS, build_entity_store,
+    build_maid_index, calculate_score, explain_matches, export_chunks, incremental_match_results,
+    ingest_upload, match_pairs, pair_file_results, pair_labels, pair_tensor, pair_tensor_scores,
+    pool_tensor, pool_tensor_top_k, query_maid_index, result_page, result_view, scoring_config_hash,
+    signature_compression, solve_assignment, unique_clients, unique_maids, upload_digest,
+    write_results
+)
+
 # ------------------------------
 # Page Config
 # -------------------------------
 st.set_page_config(layout="wide")
 
 # -------------------------------
-# CONFIG
+# PERFORMANCE PANEL (controls)
 # -------------------------------
-THEME_WEIGHTS = {
-    "household_kids": 9,
-    "special_cases": 8,
-    "pets": 8,
-    "living": 9,
-    "nationality": 8,
-    "cuisine": 6
-}
+PERF_HISTORY = 50  # reruns kept in the panel
 
-BONUS_CAP = 10  # max total bonus %
+def widget_state():
+    """Current value of every keyed widget, comparable across reruns."""
+    return {
+        key: str(getattr(value, "file_id", value))
+        for key, value in st.session_state.items()
+        if not key.startswith("_")
+    }
+
+rerun_start = time.perf_counter()
+perf_panel = st.sidebar.expander("Performance")
+with perf_panel:
+    perf_detailed = st.checkbox("Time score_* helpers", key="perf_detailed")
+    perf_sample = st.number_input("Time one call in", min_value=1, value=100, step=1, key="perf_sample")
+    perf_profile = st.checkbox("cProfile each rerun", key="perf_profile")
+if perf_detailed:
+    perf.instrument(matching, SCALAR_HELPERS, perf_sample)
+elif perf.instrumented():
+    perf.uninstrument()
+profiler = cProfile.Profile() if perf_profile else None
+if profiler:
+    profiler.enable()
 
 # -------------------------------
-# HELPER FUNCTIONS WITH EXPLANATIONS
+# WHAT-IF WEIGHTS
 # -------------------------------
+# Scores under edited weights come from the weight-free score tensors, so
+# trying weights never rescores the fields; results and explanations keep
+# using the configured THEME_WEIGHTS and BONUS_CAP.
+MAX_WEIGHT = 50
 
-def score_household_kids(client, maid, exp):
-    w = THEME_WEIGHTS["household_kids"]
-    if client == "unspecified":
-        return None, "Neutral: client did not specify household type"
-    if client == "baby":
-        if maid in ["refuses_baby", "refuses_baby_and_kids"]:
-            if exp in ["lessthan2", "above2", "both"]:
-                return int(w * 1.2), "Bonus: maid has kids experience despite refusal (baby)"
-            return 0, "Mismatch: maid refuses baby care"
-        elif exp in ["lessthan2", "above2", "both"]:
-            return int(w * 1.2), "Bonus: maid has kids experience, client has baby"
-        else:
-            return w, "Match: client has baby, maid accepts"
-    if client == "many_kids":
-        if maid in ["refuses_many_kids", "refuses_baby_and_kids"]:
-            if exp in ["lessthan2", "above2", "both"]:
-                return int(w * 1.2), "Bonus: maid has kids experience despite refusal (many kids)"
-            return 0, "Mismatch: maid refuses many kids"
-        elif exp in ["lessthan2", "above2", "both"]:
-            return int(w * 1.2), "Bonus: maid has kids experience, client has many kids"
-        else:
-            return w, "Match: client has many kids, maid accepts"
-    if client == "baby_and_kids":
-        if maid in ["refuses_baby_and_kids", "refuses_baby", "refuses_many_kids"]:
-            if exp in ["lessthan2", "above2", "both"]:
-                return int(w * 1.2), "Bonus: maid has kids experience despite refusal (baby_and_kids)"
-            return 0, "Mismatch: maid refuses baby_and_kids"
-        elif exp in ["lessthan2", "above2", "both"]:
-            return int(w * 1.2), "Bonus: maid has kids experience, client has baby_and_kids"
-        else:
-            return w, "Match: client has baby_and_kids, maid accepts"
-    return None, "Neutral"
-
-def score_special_cases(client, maid):
-    w = THEME_WEIGHTS["special_cases"]
-    if client == "unspecified":
-        return None, "Neutral: client did not specify special cases"
-    if client == "elderly":
-        if maid in ["elderly_experienced", "elderly_and_special"]:
-            return w, "Match: elderly supported"
-        elif maid == "special_needs":
-            return int(w * 0.6), "Partial: client elderly, maid only has special_needs"
-    if client == "special_needs":
-        if maid in ["special_needs", "elderly_and_special"]:
-            return w, "Match: special needs supported"
-        elif maid == "elderly_experienced":
-            return int(w * 0.6), "Partial: client special_needs, maid only elderly"
-    if client == "elderly_and_special":
-        if maid == "elderly_and_special":
-            return w, "Perfect match: elderly + special needs"
-        elif maid in ["elderly_experienced", "special_needs"]:
-            return int(w * 0.6), "Partial: maid covers only one"
-    return None, "Neutral"
-
-def score_pets(client, maid, handling):
-    w = THEME_WEIGHTS["pets"]
-    if client == "unspecified":
-        return None, "Neutral: client did not specify pets"
-    if client == "cat":
-        if maid in ["refuses_cat", "refuses_both_pets"]:
-            if handling in ["cats", "both"]:
-                return int(w * 1.2), "Bonus: maid reports cat handling despite refusal"
-            return 0, "Mismatch: maid refuses cats"
-        elif handling in ["cats", "both"]:
-            return int(w * 1.2), "Bonus: maid has cat handling experience"
-        else:
-            return w, "Match: cats allowed"
-    if client == "dog":
-        if maid in ["refuses_dog", "refuses_both_pets"]:
-            if handling in ["dogs", "both"]:
-                return int(w * 1.2), "Bonus: maid reports dog handling despite refusal"
-            return 0, "Mismatch: maid refuses dogs"
-        elif handling in ["dogs", "both"]:
-            return int(w * 1.2), "Bonus: maid has dog handling experience"
-        else:
-            return w, "Match: dogs allowed"
-    if client == "both":
-        if maid in ["refuses_both_pets", "refuses_cat", "refuses_dog"]:
-            if handling in ["cats", "dogs", "both"]:
-                return int(w * 1.2), "Bonus: maid reports pet handling despite refusal"
-            return 0, "Mismatch: maid refuses one or both pets"
-        elif handling == "both":
-            return int(w * 1.2), "Bonus: maid prefers handling both cats & dogs"
-        else:
-            return w, "Match: both cats & dogs allowed"
-    return None, "Neutral"
-
-def score_living(client, maid):
-    w = THEME_WEIGHTS["living"]
-    if client == "unspecified":
-        return None, "Neutral: client did not specify living arrangement"
-
-    # Client requires private room
-    if client in ["private_room", "live_out+private_room"]:
-        return w, "Match: private room requirement satisfied"
-
-    # Client requires Abu Dhabi posting
-    if client in ["private_room+abu_dhabi", "live_out+private_room+abu_dhabi"]:
-        if "refuses_abu_dhabi" in maid:
-            return 0, "Mismatch: maid refuses Abu Dhabi"
-        else:
-            return w, "Match: Abu Dhabi posting acceptable"
-
-    return None, "Neutral"
-
-def score_nationality(client, maid):
-    w = THEME_WEIGHTS["nationality"]
-    if client == "any":
-        return w, f"Match: client accepts any nationality, maid is {maid}"
-    mapping = {
-        "filipina": "filipina",
-        "ethiopian maid": "ethiopian",
-        "west african nationality": "west_african"
-    }
-    prefs = client.split("+")
-    prefs = [mapping.get(p.strip(), p.strip()) for p in prefs]
-    if maid in prefs:
-        return w, f"Match: client prefers {client}, maid is {maid}"
-    if maid == "indian":
-        return 0, "Mismatch: client does not accept indian nationality"
-    return 0, f"Mismatch: client prefers {client}, maid is {maid}"
-
-def score_cuisine(client, maid_flags):
-    w = THEME_WEIGHTS["cuisine"]
-    if client == "unspecified":
-        return None, "Neutral: client did not specify cuisine"
-    prefs = client.split("+")
-    prefs = [p.strip() for p in prefs]
-    matches = 0
-    if "lebanese" in prefs and maid_flags.get("maid_cooking_lebanese", 0) == 1:
-        matches += 1
-    if "khaleeji" in prefs and maid_flags.get("maid_cooking_khaleeji", 0) == 1:
-        matches += 1
-    if "international" in prefs and maid_flags.get("maid_cooking_international", 0) == 1:
-        matches += 1
-    if matches == 0:
-        return 0, "Mismatch: no requested cuisines matched"
-    if matches == len(prefs):
-        return w, "Perfect match: all cuisines covered"
-    if len(prefs) == 2 and matches == 1:
-        return int(w * 0.6), "Partial match: 1 of 2 cuisines covered"
-    if len(prefs) == 3:
-        if matches == 2:
-            return int(w * 0.8), "Partial match: 2 of 3 cuisines covered"
-        if matches == 1:
-            return int(w * 0.5), "Weak partial match: 1 of 3 cuisines covered"
-    return int(w * (matches / len(prefs))), f"Partial match: {matches} of {len(prefs)} cuisines covered"
-
-def score_bonuses(row):
-    bonuses, explanations = 0, []
-    langs = []
-    if row.get("maidspeaks_arabic", 0) == 1:
-        bonuses += 1; langs.append("Arabic")
-    if row.get("maidspeaks_english", 0) == 1:
-        bonuses += 1; langs.append("English")
-    if row.get("maidspeaks_french", 0) == 1:
-        bonuses += 1; langs.append("French")
-    if langs:
-        explanations.append("Bonus: speaks " + ", ".join(langs))
-    exp = row.get("years_of_experience", 0)
-    if exp >= 5:
-        bonuses += 2; explanations.append(f"Bonus: {exp} years experience")
-    elif exp >= 2:
-        bonuses += 1; explanations.append(f"Bonus: {exp} years experience")
-    edu = row.get("maidpref_education", "unspecified")
-    if edu in ["school", "both", "university"]:
-        bonuses += 1; explanations.append(f"Bonus: education = {edu}")
-    pers = row.get("maidpref_personality", "unspecified")
-    if pers != "unspecified":
-        bonuses += 1; explanations.append(f"Bonus: personality = {pers.replace('+', ', ')}")
-    travel = row.get("maidpref_travel", "unspecified")
-    if travel == "travel":
-        bonuses += 1; explanations.append("Bonus: open to travel")
-    elif travel in ["relocate", "travel_and_relocate"]:
-        bonuses += 2; explanations.append("Bonus: open to travel & relocation")
-    smoking = row.get("maidpref_smoking", "unspecified")
-    if smoking == "non_smoker":
-        bonuses += 1; explanations.append("Bonus: non-smoker")
-    return min(bonuses, BONUS_CAP), explanations
-
-def calculate_score(row):
-    theme_scores = {}
-    scores, max_weights = [], []
-    s, r = score_household_kids(row["clientmts_household_type"], row["maidmts_household_type"], row["maidpref_kids_experience"])
-    theme_scores["Household & Kids Reason"] = r
-    if s is not None: scores.append(s); max_weights.append(THEME_WEIGHTS["household_kids"])
-    s, r = score_special_cases(row["clientmts_special_cases"], row["maidpref_caregiving_profile"])
-    theme_scores["Special Cases Reason"] = r
-    if s is not None: scores.append(s); max_weights.append(THEME_WEIGHTS["special_cases"])
-    s, r = score_pets(row["clientmts_pet_type"], row["maidmts_pet_type"], row["maidpref_pet_handling"])
-    theme_scores["Pets Reason"] = r
-    if s is not None: scores.append(s); max_weights.append(THEME_WEIGHTS["pets"])
-    s, r = score_living(row["clientmts_living_arrangement"], row["maidmts_living_arrangement"])
-    theme_scores["Living Reason"] = r
-    if s is not None: scores.append(s); max_weights.append(THEME_WEIGHTS["living"])
-    s, r = score_nationality(row["clientmts_nationality_preference"], row["maid_grouped_nationality"])
-    theme_scores["Nationality Reason"] = r
-    if s is not None: scores.append(s); max_weights.append(THEME_WEIGHTS["nationality"])
-    maid_flags = {
-        "maid_cooking_lebanese": row["maid_cooking_lebanese"],
-        "maid_cooking_khaleeji": row["maid_cooking_khaleeji"],
-        "maid_cooking_international": row["maid_cooking_international"]
+with st.sidebar.expander("Weights (what-if)"):
+    whatif_weights = {
+        theme: int(st.number_input(theme, min_value=1, max_value=MAX_WEIGHT, value=weight, step=1, key=f"weight_{theme}"))
+        for theme, weight in THEME_WEIGHTS.items()
     }
-    s, r = score_cuisine(row["clientmts_cuisine_preference"], maid_flags)
-    theme_scores["Cuisine Reason"] = r
-    if s is not None: scores.append(s); max_weights.append(THEME_WEIGHTS["cuisine"])
-    if not scores:
-        return 0, "Neutral", theme_scores, []
-    base_score = sum(scores) / sum(max_weights) * 100
-    bonus, bonus_reasons = score_bonuses(row)
-    final_score = min(base_score + bonus, 100)
-    return round(final_score, 1), theme_scores, bonus_reasons
+    whatif_cap = int(st.number_input("bonus cap", min_value=0, max_value=MAX_WEIGHT, value=BONUS_CAP, step=1, key="weight_bonus_cap"))
+    whatif = whatif_weights != THEME_WEIGHTS or whatif_cap != BONUS_CAP
+    if whatif:
+        st.code(f"THEME_WEIGHTS = {json.dumps(whatif_weights, indent=4)}\nBONUS_CAP = {whatif_cap}", language="python")
+
+# -------------------------------
+# COMPUTE LAYER
+# -------------------------------
+# Everything expensive is cached by upload digest plus scoring config hash and
+# handed back as the same objects on every rerun (cache_resource, no copy), so
+# a widget change only re-renders. Results are read-only. Arguments with a
+# leading underscore are not hashed by Streamlit; the keys stand in for them.
+COMPUTE_CACHE_ENTRIES = 8
+
+@st.cache_resource(max_entries=COMPUTE_CACHE_ENTRIES)
+def upload_key(file_id, _data):
+    # One sha256 per upload instead of one per rerun
+    return upload_digest(_data)
+
+@st.cache_resource(show_spinner="Loading dataset...", max_entries=COMPUTE_CACHE_ENTRIES)
+def load_dataset(digest, name, _data):
+    return ingest_upload(_data, name, digest=digest)
+
+@st.cache_resource(show_spinner="Scoring pairs...", max_entries=COMPUTE_CACHE_ENTRIES)
+@perf.timed("compute.pair_file")
+def pair_file_scores(digest, config, _df):
+    results, keys = pair_file_results(_df)
+    return results, keys, pair_labels(results)
+
+@st.cache_resource(max_entries=COMPUTE_CACHE_ENTRIES)
+@perf.timed("compute.entities")
+def entity_tables(digest, config, _df):
+    clients_df, maids_df = unique_clients(_df), unique_maids(_df)
+    return clients_df, maids_df, signature_compression(clients_df, maids_df), build_entity_store(clients_df, maids_df)
+
+@st.cache_resource(show_spinner="Matching...", max_entries=COMPUTE_CACHE_ENTRIES)
+@perf.timed("compute.optimal_matches")
+def optimal_matches_for(digest, config, k, _clients_df, _maids_df, _entities):
+    # Unchanged clients and maids reuse their lists from the on-disk score store
+    results, keys, stats = incremental_match_results(_clients_df, _maids_df, k, entities=_entities)
+    return results, keys, pair_labels(results), stats
+
+@st.cache_resource(show_spinner="Assigning...", max_entries=COMPUTE_CACHE_ENTRIES)
+@perf.timed("compute.assignment")
+def assignment_for(digest, config, capacity, quota, candidates, _clients_df, _maids_df, _entities):
+    pairs, stats = solve_assignment(_clients_df, _maids_df, capacity, quota, candidates)
+    results, keys = match_pairs(_clients_df, _maids_df, pairs["client_idx"], pairs["maid_idx"], _entities)
+    return results, keys, pair_labels(results), stats
+
+@st.cache_resource(max_entries=COMPUTE_CACHE_ENTRIES)
+@perf.timed("compute.maid_index")
+def maid_index_for(digest, config, _maids_df):
+    return build_maid_index(_maids_df)
+
+@st.cache_resource(max_entries=COMPUTE_CACHE_ENTRIES)
+@perf.timed("compute.pair_tensor")
+def pair_tensor_for(digest, config, _df):
+    return pair_tensor(_df)
+
+@st.cache_resource(max_entries=COMPUTE_CACHE_ENTRIES)
+@perf.timed("compute.pool_tensor")
+def pool_tensor_for(digest, config, _clients_df, _maids_df):
+    return pool_tensor(_clients_df, _maids_df)
+
+@st.cache_resource(max_entries=COMPUTE_CACHE_ENTRIES)
+def whatif_pair_scores(digest, config, weights, bonus_cap, _tensor):
+    return pair_tensor_scores(_tensor, dict(weights), bonus_cap)
+
+@st.cache_resource(max_entries=COMPUTE_CACHE_ENTRIES)
+def whatif_top_k(digest, config, k, weights, bonus_cap, _tensor):
+    # weights is a tuple of items so it can be hashed
+    return pool_tensor_top_k(_tensor, k, dict(weights), bonus_cap)
+
+# -------------------------------
+# RENDERING
+# -------------------------------
+def show_reasons(row):
+    st.write("**Household & Kids:**", row["Household & Kids Reason"])
+    st.write("**Special Cases:**", row["Special Cases Reason"])
+    st.write("**Pets:**", row["Pets Reason"])
+    st.write("**Living:**", row["Living Reason"])
+    st.write("**Nationality:**", row["Nationality Reason"])
+    st.write("**Cuisine:**", row["Cuisine Reason"])
+    st.write("**Bonus:**", row["Bonus Reasons"])
+
+def pair_explanation(label, results, keys, labels, rows, key):
+    # The options are the visible rows and the pick is a row index
+    i = st.selectbox(label, rows, format_func=labels.__getitem__, key=key)
+    if i is not None:
+        with perf.timer("explain.pair"):
+            row = explain_matches(results, keys, [i]).iloc[0]
+        st.subheader(f"Explanation for {row['client_name']} ↔ {row['maid_id']}")
+        show_reasons(row)
+
+PAGE_SIZES = [25, 50, 100, 250, 1000]
+
+@st.fragment
+def result_table(results, keys, labels, key, file_name, download_label, explain_label=None,
+                 extra=None, score="Final Score %"):
+    # A fragment over a cached result table: filtering, sorting, paging and
+    # picking a pair rerun only this, and only the visible page (and its pair
+    # labels) is sent to the browser. extra holds columns aligned with results.
+    extra = extra or {}
+    sortable = [c for c in results.columns if c not in REASON_THEMES.values()] + list(extra)
+    f1, f2, f3, f4, f5 = st.columns([1, 2, 2, 2, 1])
+    min_score = f1.number_input("Min score %", min_value=0.0, max_value=100.0, value=0.0, step=5.0, key=f"{key}_min")
+    client = f2.text_input("Client contains", key=f"{key}_client")
+    maid = f3.text_input("Maid contains", key=f"{key}_maid")
+    sort_by = f4.selectbox("Sort by", [None] + sortable, format_func=lambda c: c or "file order", key=f"{key}_sort")
+    descending = f5.checkbox("Descending", value=True, key=f"{key}_desc")
+
+    # The view is kept per table until the results or filters change, so paging does not refilter
+    params = (min_score, client, maid, sort_by, descending)
+    sources = [results, *extra.values()]
+    cached = st.session_state.get(f"_view_{key}")
+    if cached and cached[1] == params and len(cached[0]) == len(sources) and all(a is b for a, b in zip(cached[0], sources)):
+        rows = cached[2]
+    else:
+        rows = result_view(results, min_score or None, client, maid, sort_by, descending, extra, score)
+        if cached and cached[1] != params:
+            st.session_state[f"{key}_page"] = 1  # new filters start on the first page
+        st.session_state[f"_view_{key}"] = (sources, params, rows)
+
+    p1, p2 = st.columns([1, 4])
+    page_size = p1.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size")
+    n_pages = max(1, -(-len(rows) // page_size))
+    if st.session_state.get(f"{key}_page", 1) > n_pages:
+        st.session_state[f"{key}_page"] = n_pages
+    page = int(p2.number_input(f"Page (of {n_pages:,})", min_value=1, max_value=n_pages, step=1, key=f"{key}_page")) - 1
+    shown = result_page(results, rows, page, page_size, extra)
+    with perf.timer(f"render.{key}"):
+        st.dataframe(shown)
+    filtered = f" (filtered from {len(results):,})" if len(rows) < len(results) else ""
+    if len(rows):
+        st.caption(f"Rows {page * page_size + 1:,}–{page * page_size + len(shown):,} of {len(rows):,}{filtered}.")
+    else:
+        st.caption(f"No rows match{filtered}.")
+
+    if explain_label and len(shown):
+        pair_explanation(explain_label, results, keys, labels, shown.index.tolist(), f"{key}_pair")
+
+    # Exports follow the view and are written chunk by chunk; the button needs the whole file as bytes
+    fmt = st.selectbox("Export format", list(EXPORT_FORMATS), key=f"{key}_format")
+    mime, suffix = EXPORT_FORMATS[fmt]
+
+    @perf.timed(f"export.{key}")
+    def export_view():
+        buffer = io.BytesIO()
+        write_results(export_chunks(results, keys, rows), buffer, fmt)
+        return buffer.getvalue()
+
+    st.download_button(f"{download_label} ({len(rows):,} rows)", export_view, f"{file_name}{suffix}", mime, key=f"{key}_download")
+
+@st.fragment
+def customer_interface(maids_df, maid_index):
+    # Input widgets
+    c_household = st.selectbox("Household Type", ["unspecified", "baby", "many_kids", "baby_and_kids"], key="c_household")
+    c_special = st.selectbox("Special Cases", ["unspecified", "elderly", "special_needs", "elderly_and_special"], key="c_special")
+    c_pets = st.selectbox("Pet Type", ["unspecified", "cat", "dog", "both"], key="c_pets")
+    c_living = st.selectbox("Living Arrangement", [
+        "unspecified", "private_room", "live_out+private_room",
+        "private_room+abu_dhabi", "live_out+private_room+abu_dhabi"
+    ], key="c_living")
+    c_nationality = st.selectbox("Nationality Preference", [
+        "any", "filipina", "ethiopian maid", "west african nationality", "indian"
+    ], key="c_nationality")
+    c_cuisine = st.multiselect("Cuisine Preference", ["lebanese", "khaleeji", "international"], key="c_cuisine")
+    cuisine_pref = "+".join(c_cuisine) if c_cuisine else "unspecified"
+
+    # Button to run match
+    if st.button("Find Best Maids", key="find_maids"):
+        client_row = {
+            "clientmts_household_type": c_household,
+            "clientmts_special_cases": c_special,
+            "clientmts_pet_type": c_pets,
+            "clientmts_living_arrangement": c_living,
+            "clientmts_nationality_preference": c_nationality,
+            "clientmts_cuisine_preference": cuisine_pref
+        }
+
+        maid_idx, _ = query_maid_index(maid_index, client_row, k=3)
+        top_matches = []
+        for i in maid_idx:
+            maid_row = maids_df.iloc[i]
+            score, reasons, bonus_reasons = calculate_score({**client_row, **maid_row.to_dict()})
+            top_matches.append({
+                "maid_id": maid_row["maid_id"],
+                "Final Score %": score,
+                **reasons,
+                "Bonus Reasons": ", ".join(bonus_reasons) if bonus_reasons else "None"
+            })
+        top_df = pd.DataFrame(top_matches)
+        st.dataframe(top_df)
+
+        # Detailed explanations
+        for match in top_matches:
+            with st.expander(f"Maid {match['maid_id']} → {match['Final Score %']}%"):
+                show_reasons(match)
 
 # -------------------------------
 # STREAMLIT APP
 # -------------------------------
 st.title("Client–Maid Matching Score Calculator")
 
-uploaded_file = st.file_uploader("Upload your dataset (CSV or Excel)", type=["csv", "xlsx"])
+uploaded_file = st.file_uploader("Upload your dataset (CSV or Excel)", type=["csv", "xlsx"], key="upload")
 if uploaded_file:
-    df = pd.read_csv(uploaded_file) if uploaded_file.name.endswith(".csv") else pd.read_excel(uploaded_file)
+    data = uploaded_file.getvalue()
+    digest = upload_key(uploaded_file.file_id, data)
+    config = scoring_config_hash()
+    try:
+        df, ingest = load_dataset(digest, uploaded_file.name, data)
+    except ValueError as e:
+        st.error(str(e).replace("\n", "  \n"))
+        st.stop()
+    st.caption(
+        f"Loaded {len(df):,} rows ({'Parquet cache' if ingest['source'] == 'cache' else 'parsed'}, "
+        f"{ingest['seconds']:.2f}s): {ingest['bytes'] / 2**20:,.1f} MB in memory vs "
+        f"{ingest['raw_bytes'] / 2**20:,.1f} MB raw, saved {ingest['saved_bytes'] / 2**20:,.1f} MB "
+        f"({ingest['saved_pct']:.0f}%)."
+    )
 
     # Create tabs
     tab1, tab2, tab3 = st.tabs(["Matching Scores", "Optimal Matches","Customer Interface"])
@@ -252,66 +289,31 @@ if uploaded_file:
     # ---------------- Tab 1: Existing Matching ----------------
     with tab1:
         st.write("### Matching Scores (Key Fields Only)")
-        results = []
-        for _, row in df.iterrows():
-            score, reasons, bonus_reasons = calculate_score(row)
-            result_row = {
-                "client_name": row["client_name"],
-                "maid_id": row["maid_id"],
-                "Final Score %": score,
-                **reasons,
-                "Bonus Reasons": ", ".join(bonus_reasons) if bonus_reasons else "None"
-            }
-            results.append(result_row)
-        results_df = pd.DataFrame(results)
-        st.dataframe(results_df)
-
-        st.write("### Detailed Explanations")
-        pair_options = results_df.apply(lambda r: f"{r['client_name']} ↔ {r['maid_id']} ({r['Final Score %']}%)", axis=1)
-        selected_pair = st.selectbox("Select a Client–Maid Pair", pair_options)
-
-        if selected_pair:
-            row = results_df.iloc[pair_options.tolist().index(selected_pair)]
-            st.subheader(f"Explanation for {row['client_name']} ↔ {row['maid_id']}")
-            st.write("**Household & Kids:**", row["Household & Kids Reason"])
-            st.write("**Special Cases:**", row["Special Cases Reason"])
-            st.write("**Pets:**", row["Pets Reason"])
-            st.write("**Living:**", row["Living Reason"])
-            st.write("**Nationality:**", row["Nationality Reason"])
-            st.write("**Cuisine:**", row["Cuisine Reason"])
-            st.write("**Bonus:**", row["Bonus Reasons"])
-
-        st.download_button("Download Results CSV", results_df.to_csv(index=False).encode("utf-8"), "matching_results.csv", "text/csv")
-
-    
+        # Scores and reason codes only; text is rendered for the selected pair and the export
+        results_df, reason_keys, results_labels = pair_file_scores(digest, config, df)
+        extra = {}
+        if whatif:
+            extra["What-if Score %"] = whatif_pair_scores(
+                digest, config, tuple(whatif_weights.items()), whatif_cap, pair_tensor_for(digest, config, df)
+            )
+        result_table(
+            results_df, reason_keys, results_labels, "tab1", "matching_results", "Download Results",
+            "Select a Client–Maid Pair", extra
+        )
 
     # ---------------- Tab 2: Optimal Matches ----------------
-    # ---------------- Preprocessing Step ----------------
-    # Keep only relevant columns
     with tab2:
-        client_cols = [
-            "client_name", "clientmts_household_type", "clientmts_special_cases",
-            "clientmts_pet_type", "clientmts_dayoff_policy",
-            "clientmts_nationality_preference", "clientmts_living_arrangement",
-            "clientmts_cuisine_preference"
-        ]
-        
-        maid_cols = [
-            "maid_id", "years_of_experience", "maidspeaks_amharic", "maidspeaks_arabic",
-            "maidspeaks_english", "maidspeaks_french", "maidspeaks_oromo",
-            "maid_grouped_nationality", "maid_cooking_khaleeji", "maid_cooking_lebanese",
-            "maid_cooking_international", "maid_cooking_not_specified",
-            "maidmts_household_type", "maidmts_pet_type", "maidmts_dayoff_policy",
-            "maidmts_living_arrangement", "maidpref_education", "maidpref_kids_experience",
-            "maidpref_pet_handling", "maidpref_personality", "maidpref_travel",
-            "maidpref_smoking", "maidpref_caregiving_profile"
-        ]
-        
         # Split into clients and maids
-        clients_df = df[client_cols].drop_duplicates(subset=["client_name"]).reset_index(drop=True)
-        maids_df = df[maid_cols].drop_duplicates(subset=["maid_id"]).reset_index(drop=True)
+        clients_df, maids_df, compression, entities = entity_tables(digest, config, df)
         
         st.write(f" Deduplication complete: {len(clients_df)} unique clients, {len(maids_df)} unique maids.")
+
+        # Group by scoring-relevant fields so each distinct profile pair is scored once
+        st.write(
+            f" Profile signatures: {compression['client_profiles']} client profiles × "
+            f"{compression['maid_profiles']} maid profiles = {compression['profile_pairs']:,} scored pairs "
+            f"instead of {compression['pairs']:,} ({compression['ratio']:.1f}x compression)."
+        )
     
         # Preview clients_df
         st.write("### Clients (deduplicated)")
@@ -323,120 +325,105 @@ if uploaded_file:
         st.dataframe(maids_df.head(20))   # show first 20 rows
         st.write("Maid columns:", maids_df.columns.tolist())
 
-        st.write("### Optimal Matches (Top 2 Maids per Client)")
-    
-        @st.cache_data
-        def compute_optimal_matches(clients_df, maids_df):
-            results = []
-            for _, client_row in clients_df.iterrows():
-                candidate_scores = []
-                for _, maid_row in maids_df.iterrows():
-                    combined_row = {**client_row.to_dict(), **maid_row.to_dict()}
-                    score, reasons, bonus_reasons = calculate_score(combined_row)
-                    candidate_scores.append({
-                        "maid_id": maid_row["maid_id"],
-                        "Final Score %": score,
-                        **reasons,
-                        "Bonus Reasons": ", ".join(bonus_reasons) if bonus_reasons else "None"
-                    })
-                # pick top 2
-                top_matches = sorted(candidate_scores, key=lambda x: x["Final Score %"], reverse=True)[:2]
-                for match in top_matches:
-                    results.append({
-                        "client_name": client_row["client_name"],
-                        "maid_id": match["maid_id"],
-                        "Final Score %": match["Final Score %"],
-                        "Household & Kids Reason": match["Household & Kids Reason"],
-                        "Special Cases Reason": match["Special Cases Reason"],
-                        "Pets Reason": match["Pets Reason"],
-                        "Living Reason": match["Living Reason"],
-                        "Nationality Reason": match["Nationality Reason"],
-                        "Cuisine Reason": match["Cuisine Reason"],
-                        "Bonus Reasons": match["Bonus Reasons"]
-                    })
-            return pd.DataFrame(results)
-    
-        # Run cached optimal matches
-        optimal_df = compute_optimal_matches(clients_df, maids_df)
-        st.dataframe(optimal_df)
-    
-        # Dropdown for explanations
-        pair_options = optimal_df.apply(
-            lambda r: f"{r['client_name']} ↔ {r['maid_id']} ({r['Final Score %']}%)", axis=1
-        )
-        selected_pair = st.selectbox("Select a Client–Maid Pair for Detailed Explanation", pair_options)
-    
-        if selected_pair:
-            row = optimal_df.iloc[pair_options.tolist().index(selected_pair)]
-            st.subheader(f"Explanation for {row['client_name']} ↔ {row['maid_id']}")
-            st.write("**Household & Kids:**", row["Household & Kids Reason"])
-            st.write("**Special Cases:**", row["Special Cases Reason"])
-            st.write("**Pets:**", row["Pets Reason"])
-            st.write("**Living:**", row["Living Reason"])
-            st.write("**Nationality:**", row["Nationality Reason"])
-            st.write("**Cuisine:**", row["Cuisine Reason"])
-            st.write("**Bonus:**", row["Bonus Reasons"])
-    
-        st.download_button(
-            "Download Optimal Matches CSV",
-            optimal_df.to_csv(index=False).encode("utf-8"),
-            "optimal_matches.csv",
-            "text/csv"
+        match_mode = st.radio("Match mode", ["Top maids per client", "Capacity-aware assignment"], horizontal=True, key="match_mode")
+        if match_mode == "Top maids per client":
+            top_k = st.number_input("Maids per client", min_value=1, max_value=max(1, len(maids_df)), value=min(2, max(1, len(maids_df))), step=1, key="top_k")
+            st.write(f"### Optimal Matches (Top {top_k} Maids per Client)")
+            optimal_df, optimal_keys, optimal_labels, reuse = optimal_matches_for(digest, config, int(top_k), clients_df, maids_df, entities)
+            st.write(
+                f" Score store: reused {reuse['pairs_reused']:,} pairs, recomputed {reuse['pairs_recomputed']:,} "
+                f"({reuse['clients_rescored']} clients rescored, {reuse['maids_changed']} new or changed maids)."
+            )
+            if whatif:
+                maid_idx, whatif_scores = whatif_top_k(
+                    digest, config, int(top_k), tuple(whatif_weights.items()), whatif_cap,
+                    pool_tensor_for(digest, config, clients_df, maids_df)
+                )
+                whatif_df = pd.DataFrame({
+                    "client_name": clients_df["client_name"].to_numpy().repeat(maid_idx.shape[1]),
+                    "maid_id": maids_df["maid_id"].to_numpy()[maid_idx.ravel()],
+                    "What-if Score %": whatif_scores.ravel()
+                })
+                moved = (whatif_df["maid_id"].to_numpy() != optimal_df["maid_id"].to_numpy()).reshape(maid_idx.shape).any(axis=1)
+                st.write(f"### What-if Matches ({moved.sum():,} of {len(moved):,} clients get different maids)")
+                result_table(whatif_df, None, None, "tab2_whatif", "whatif_matches", "Download What-if Matches", score="What-if Score %")
+        else:
+            maid_capacity = st.number_input("Clients per maid (capacity)", min_value=1, value=1, step=1, key="maid_capacity")
+            client_quota = st.number_input("Maids per client (quota)", min_value=1, value=1, step=1, key="client_quota")
+            n_candidates = st.number_input("Candidate maids per client", min_value=1, max_value=max(1, len(maids_df)), value=min(20, max(1, len(maids_df))), step=1, key="n_candidates")
+            st.write(f"### Optimal Matches (Assignment, {maid_capacity} Clients per Maid)")
+            optimal_df, optimal_keys, optimal_labels, stats = assignment_for(
+                digest, config, int(maid_capacity), int(client_quota), int(n_candidates), clients_df, maids_df, entities
+            )
+            st.write(
+                f" Assigned {stats['assigned']:,} pairs, {stats['unassigned_clients']:,} of {len(clients_df):,} clients "
+                f"without a maid; total score {stats['total']:,.1f} vs greedy {stats['greedy_total']:,.1f} "
+                f"({stats['greedy_assigned']:,} pairs, {stats['greedy_unassigned_clients']:,} clients without a maid): "
+                f"gap {stats['greedy_gap']:,.1f} ({stats['greedy_gap_pct']:.2f}%). "
+                f"Candidate graph: {stats['candidate_edges']:,} edges after {stats['rounds']} rounds."
+            )
+        result_table(
+            optimal_df, optimal_keys, optimal_labels, "tab2", "optimal_matches", "Download Optimal Matches",
+            "Select a Client–Maid Pair for Detailed Explanation"
         )
-    
-
 
     # ---------------- Tab 3: Customer Interface ----------------
     with tab3:
         st.write("### Try Your Own Preferences")
-    
-        # Input widgets
-        c_household = st.selectbox("Household Type", ["unspecified", "baby", "many_kids", "baby_and_kids"])
-        c_special = st.selectbox("Special Cases", ["unspecified", "elderly", "special_needs", "elderly_and_special"])
-        c_pets = st.selectbox("Pet Type", ["unspecified", "cat", "dog", "both"])
-        c_living = st.selectbox("Living Arrangement", [
-            "unspecified", "private_room", "live_out+private_room",
-            "private_room+abu_dhabi", "live_out+private_room+abu_dhabi"
-        ])
-        c_nationality = st.selectbox("Nationality Preference", [
-            "any", "filipina", "ethiopian maid", "west african nationality", "indian"
-        ])
-        c_cuisine = st.multiselect("Cuisine Preference", ["lebanese", "khaleeji", "international"])
-        cuisine_pref = "+".join(c_cuisine) if c_cuisine else "unspecified"
-    
-        # Button to run match
-        if st.button("Find Best Maids"):
-            client_row = {
-                "clientmts_household_type": c_household,
-                "clientmts_special_cases": c_special,
-                "clientmts_pet_type": c_pets,
-                "clientmts_living_arrangement": c_living,
-                "clientmts_nationality_preference": c_nationality,
-                "clientmts_cuisine_preference": cuisine_pref
-            }
-    
-            results = []
-            for _, maid_row in maids_df.iterrows():
-                row = {**client_row, **maid_row.to_dict()}
-                score, reasons, bonus_reasons = calculate_score(row)
-                results.append({
-                    "maid_id": maid_row["maid_id"],
-                    "Final Score %": score,
-                    **reasons,
-                    "Bonus Reasons": ", ".join(bonus_reasons) if bonus_reasons else "None"
-                })
-    
-            top_matches = sorted(results, key=lambda x: x["Final Score %"], reverse=True)[:3]
-            top_df = pd.DataFrame(top_matches)
-            st.dataframe(top_df)
-    
-            # Detailed explanations
-            for match in top_matches:
-                with st.expander(f"Maid {match['maid_id']} → {match['Final Score %']}%"):
-                    st.write("**Household & Kids:**", match["Household & Kids Reason"])
-                    st.write("**Special Cases:**", match["Special Cases Reason"])
-                    st.write("**Pets:**", match["Pets Reason"])
-                    st.write("**Living:**", match["Living Reason"])
-                    st.write("**Nationality:**", match["Nationality Reason"])
-                    st.write("**Cuisine:**", match["Cuisine Reason"])
-                    st.write("**Bonus:**", match["Bonus Reasons"])
+        customer_interface(maids_df, maid_index_for(digest, config, maids_df))
+
+# -------------------------------
+# PERFORMANCE PANEL (report)
+# -------------------------------
+# Stats are reset after each report, so exports run between reruns show up in the next one
+if profiler:
+    profiler.disable()
+    st.session_state["_perf_profile_dump"] = perf.profile_dump(profiler)
+widgets = widget_state()
+previous = st.session_state.get("_perf_widgets", {})
+history = st.session_state.setdefault("_perf_history", [])
+history.append({
+    "rerun": len(history) and history[-1]["rerun"] + 1,
+    "seconds": time.perf_counter() - rerun_start,
+    "changed": sorted(k for k in widgets if widgets[k] != previous.get(k, widgets[k])),
+    **perf.snapshot()
+})
+del history[:-PERF_HISTORY]
+st.session_state["_perf_widgets"] = widgets
+perf.reset()
+
+with perf_panel:
+    last = history[-1]
+    st.caption(f"Rerun {last['rerun']}: {last['seconds']:.3f}s, changed: {', '.join(last['changed']) or 'nothing'}")
+    if last["timers"]:
+        st.dataframe(
+            pd.DataFrame.from_dict(last["timers"], orient="index").sort_values("estimated_s", ascending=False),
+            column_config={"seconds": None}
+        )
+    if last["counters"]:
+        st.write(last["counters"])
+    st.write("Rerun history")
+    st.dataframe(pd.DataFrame([
+        {
+            "rerun": h["rerun"],
+            "seconds": round(h["seconds"], 3),
+            "changed": ", ".join(h["changed"]),
+            "slowest": max(h["timers"], key=lambda t: h["timers"][t]["estimated_s"], default="")
+        }
+        for h in reversed(history)
+    ]), hide_index=True)
+    st.download_button(
+        "Download timings JSON",
+        json.dumps(history, indent=2).encode("utf-8"),
+        "perf_history.json",
+        "application/json",
+        key="perf_json"
+    )
+    if "_perf_profile_dump" in st.session_state:
+        st.download_button(
+            "Download last cProfile dump",
+            st.session_state["_perf_profile_dump"],
+            "rerun.prof",
+            "application/octet-stream",
+            key="perf_prof"
+        )
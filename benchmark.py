@@ -0,0 +1,315 @@
+"""Benchmarks for the scorers and the app's matching paths.
+
+    python -m benchmark                                    # default scales, JSON on stdout
+    python -m benchmark --scales 500x500x5000 --out bench.json
+    python -m benchmark --baseline bench.json --tolerance 1.25
+
+A scale is "<clients>x<maids>x<pairs>". Every benchmark records its best and
+median wall time over --repeat runs. With --baseline, a result slower than
+the baseline time x tolerance (plus a small absolute slack) is marked as a
+regression. Before timing, each fast path is checked against the scalar
+reference (calculate_score and the original tab loops). The exit status is
+1 if any parity check fails or any benchmark regressed.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import matching
+from matching import (
+    THEME_COLUMNS, batch_theme_scores, build_maid_index, calculate_score, explain_matches,
+    incremental_top_k, optimal_matches, pair_tensor, pair_tensor_scores, pool_tensor, pool_tensor_top_k,
+    query_maid_index, score_bonuses, score_cuisine, score_frame, score_household_kids, score_living,
+    score_nationality, score_pairs, score_pets, score_special_cases, top_k_matches, top_match_results
+)
+from synthetic import make_dataset
+
+DEFAULT_SCALES = ["200x200x2000", "2000x2000x20000", "10000x10000x100000"]
+PARITY_SCALE = "60x80x3000"
+WHATIF_WEIGHTS = {"household_kids": 12, "special_cases": 5, "pets": 8, "living": 3, "nationality": 17, "cuisine": 9}
+WHATIF_BONUS_CAP = 6
+REFERENCE_CELLS = 10_000     # calculate_score calls allowed per reference benchmark
+TAB3_QUERIES = 50
+REGRESSION_SLACK_S = 0.002   # timings this close to the baseline never count as regressions
+
+# -------------------------------
+# REFERENCE IMPLEMENTATIONS
+# -------------------------------
+# The loops the app originally ran, kept as the yardstick for the fast paths.
+
+def _explained(score, reasons, bonus_reasons):
+    return {
+        "Final Score %": score,
+        **reasons,
+        "Bonus Reasons": ", ".join(bonus_reasons) if bonus_reasons else "None"
+    }
+
+def reference_tab1(df):
+    results = []
+    for _, row in df.iterrows():
+        results.append({"client_name": row["client_name"], "maid_id": row["maid_id"],
+                        **_explained(*calculate_score(row))})
+    return pd.DataFrame(results)
+
+def reference_optimal_matches(clients_df, maids_df, k=2):
+    results = []
+    for _, client_row in clients_df.iterrows():
+        candidate_scores = []
+        for _, maid_row in maids_df.iterrows():
+            combined_row = {**client_row.to_dict(), **maid_row.to_dict()}
+            candidate_scores.append({"maid_id": maid_row["maid_id"], **_explained(*calculate_score(combined_row))})
+        top_matches = sorted(candidate_scores, key=lambda x: x["Final Score %"], reverse=True)[:k]
+        for match in top_matches:
+            results.append({"client_name": client_row["client_name"], **match})
+    return pd.DataFrame(results)
+
+def reference_query(client_row, maids_df, k=3):
+    results = []
+    for _, maid_row in maids_df.iterrows():
+        row = {**client_row, **maid_row.to_dict()}
+        results.append({"maid_id": maid_row["maid_id"], **_explained(*calculate_score(row))})
+    return pd.DataFrame(sorted(results, key=lambda x: x["Final Score %"], reverse=True)[:k])
+
+# -------------------------------
+# PARITY
+# -------------------------------
+
+SCALAR_THEMES = {
+    "household_kids": score_household_kids,
+    "special_cases": score_special_cases,
+    "pets": score_pets,
+    "living": score_living,
+    "nationality": score_nationality
+}
+
+def _scalar_theme(theme, row):
+    if theme == "cuisine":
+        return score_cuisine(row["clientmts_cuisine_preference"], row)[0]
+    return SCALAR_THEMES[theme](*(row[c] for c in THEME_COLUMNS[theme]))[0]
+
+CLIENT_QUERY_FIELDS = [columns[0] for columns in THEME_COLUMNS.values()]
+
+def _client_query(client_row):
+    # The fields Tab 3's widgets fill in
+    return {c: client_row[c] for c in CLIENT_QUERY_FIELDS}
+
+def parity_checks(clients_df, maids_df, pairs_df):
+    """Compare every fast path with its scalar reference; returns {check: passed}."""
+    records = pairs_df.to_dict("records")
+    checks = {}
+
+    themes = batch_theme_scores(pairs_df)
+    checks["batch_theme_scores"] = all(
+        np.array_equal(themes[theme].to_numpy(),
+                       np.array([np.nan if (s := _scalar_theme(theme, r)) is None else s for r in records], dtype=float),
+                       equal_nan=True)
+        for theme in THEME_COLUMNS
+    )
+    checks["score_frame"] = np.array_equal(score_frame(pairs_df)["Final Score %"].to_numpy(),
+                                           np.array([calculate_score(r)[0] for r in records]))
+
+    scored, keys = score_pairs(pairs_df)
+    tab1 = explain_matches(pd.concat([pairs_df[["client_name", "maid_id"]], scored], axis=1), keys)
+    checks["tab1_explanations"] = tab1.to_csv(index=False) == reference_tab1(pairs_df).to_csv(index=False)
+
+    checks["optimal_matches"] = (optimal_matches(clients_df, maids_df, 2).to_csv(index=False)
+                                 == reference_optimal_matches(clients_df, maids_df, 2).to_csv(index=False))
+
+    index = build_maid_index(maids_df)
+    checks["tab3_query"] = all(
+        maids_df["maid_id"].iloc[query_maid_index(index, _client_query(row), k=3)[0]].tolist()
+        == reference_query(_client_query(row), maids_df, k=3)["maid_id"].tolist()
+        for _, row in clients_df.iterrows()
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Path(tmp) / "store.sqlite"
+        incremental_top_k(clients_df, maids_df, 2, store)
+        edited = maids_df.copy()
+        edited.loc[::7, "maidpref_travel"] = "relocate"
+        got = incremental_top_k(clients_df, edited, 2, store)
+        expected = top_k_matches(clients_df, edited, 2)
+        checks["score_store"] = np.array_equal(got[0], expected[0]) and np.array_equal(got[1], expected[1])
+
+    # What-if weights from the tensors vs the scalar helpers run with those weights
+    tensor_pairs = pair_tensor_scores(pair_tensor(pairs_df), WHATIF_WEIGHTS, WHATIF_BONUS_CAP)
+    tensor_top = pool_tensor_top_k(pool_tensor(clients_df, maids_df), 2, WHATIF_WEIGHTS, WHATIF_BONUS_CAP)
+    weights, bonus_cap = dict(matching.THEME_WEIGHTS), matching.BONUS_CAP
+    matching.THEME_WEIGHTS.update(WHATIF_WEIGHTS)
+    matching.BONUS_CAP = WHATIF_BONUS_CAP
+    try:
+        expected_pairs = np.array([calculate_score(r)[0] for r in records])
+        expected_top = reference_optimal_matches(clients_df, maids_df, 2)
+    finally:
+        matching.THEME_WEIGHTS.update(weights)
+        matching.BONUS_CAP = bonus_cap
+    checks["whatif_weights"] = (
+        np.array_equal(tensor_pairs, expected_pairs)
+        and maids_df["maid_id"].to_numpy()[tensor_top[0].ravel()].tolist() == expected_top["maid_id"].tolist()
+        and np.array_equal(tensor_top[1].ravel(), expected_top["Final Score %"].to_numpy())
+    )
+    return checks
+
+# -------------------------------
+# TIMINGS
+# -------------------------------
+
+def _time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times)
+
+def _loop(fn, args):
+    def run():
+        for a in args:
+            fn(*a)
+    return run
+
+def benchmarks(clients_df, maids_df, pairs_df, repeat=3):
+    """Time every benchmark at one scale; yields (name, items, min_s, median_s)."""
+    records = pairs_df.to_dict("records")
+
+    for theme in THEME_COLUMNS:
+        if theme == "cuisine":
+            args = [(r["clientmts_cuisine_preference"], r) for r in records]
+            fn = score_cuisine
+        else:
+            args = [tuple(r[c] for c in THEME_COLUMNS[theme]) for r in records]
+            fn = SCALAR_THEMES[theme]
+        yield (f"score_{theme}", len(args), *_time(_loop(fn, args), repeat))
+    yield ("score_bonuses", len(records), *_time(_loop(score_bonuses, [(r,) for r in records]), repeat))
+    yield ("calculate_score", len(records), *_time(_loop(calculate_score, [(r,) for r in records]), repeat))
+
+    # Tab 1: the original loop on a capped sample, the compact path on everything
+    sample = pairs_df.iloc[:REFERENCE_CELLS]
+    yield ("tab1_reference", len(sample), *_time(lambda: reference_tab1(sample), 1))
+    yield ("tab1_score_pairs", len(pairs_df), *_time(lambda: score_pairs(pairs_df), repeat))
+    yield ("score_frame", len(pairs_df), *_time(lambda: score_frame(pairs_df), repeat))
+
+    # Tab 2: top-2 per client; the reference only on as many clients as the cap allows
+    n_ref = max(1, min(len(clients_df), REFERENCE_CELLS // max(len(maids_df), 1)))
+    yield ("compute_optimal_matches_reference", n_ref * len(maids_df),
+           *_time(lambda: reference_optimal_matches(clients_df.iloc[:n_ref], maids_df, 2), 1))
+    yield ("compute_optimal_matches", len(clients_df) * len(maids_df),
+           *_time(lambda: top_match_results(clients_df, maids_df, 2), repeat))
+    yield ("top_k_matches", len(clients_df) * len(maids_df),
+           *_time(lambda: top_k_matches(clients_df, maids_df, 2), repeat))
+    tensor = pool_tensor(clients_df, maids_df)
+    yield ("whatif_top_k", len(clients_df) * len(maids_df),
+           *_time(lambda: pool_tensor_top_k(tensor, 2, WHATIF_WEIGHTS, WHATIF_BONUS_CAP), repeat))
+    with tempfile.TemporaryDirectory() as tmp:
+        store = Path(tmp) / "store.sqlite"
+        incremental_top_k(clients_df, maids_df, 2, store)
+        yield ("score_store_rerun", len(clients_df) * len(maids_df),
+               *_time(lambda: incremental_top_k(clients_df, maids_df, 2, store), repeat))
+
+    # Tab 3: one customer query against the whole maid pool
+    queries = [_client_query(row) for _, row in clients_df.head(TAB3_QUERIES).iterrows()]
+    yield ("tab3_build_index", len(maids_df), *_time(lambda: build_maid_index(maids_df), repeat))
+    index = build_maid_index(maids_df)
+    yield ("tab3_query", len(queries), *_time(_loop(lambda q: query_maid_index(index, q, k=3), [(q,) for q in queries]), repeat))
+    n_ref = max(1, min(len(queries), REFERENCE_CELLS // max(len(maids_df), 1)))
+    yield ("tab3_query_reference", n_ref,
+           *_time(_loop(lambda q: reference_query(q, maids_df, k=3), [(q,) for q in queries[:n_ref]]), 1))
+
+# -------------------------------
+# RUNNER
+# -------------------------------
+
+def parse_scale(scale):
+    n_clients, n_maids, n_pairs = (int(x) for x in scale.lower().split("x"))
+    return n_clients, n_maids, n_pairs
+
+def compare(results, baseline, tolerance):
+    """Mark each result against the baseline run (in place); returns the regressed ones."""
+    previous = {(r["benchmark"], r["scale"]): r for r in baseline.get("results", [])}
+    regressed = []
+    for r in results:
+        base = previous.get((r["benchmark"], r["scale"]))
+        if base is None:
+            continue
+        r["baseline_s"] = base["min_s"]
+        r["threshold_s"] = base["min_s"] * tolerance + REGRESSION_SLACK_S
+        r["regressed"] = r["min_s"] > r["threshold_s"]
+        if r["regressed"]:
+            regressed.append(r)
+    return regressed
+
+def run(scales, skew=0.0, seed=0, repeat=3, baseline=None, tolerance=1.25, log=None):
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "skew": skew,
+            "seed": seed,
+            "repeat": repeat,
+            "tolerance": tolerance,
+            "weights": matching.THEME_WEIGHTS,
+            "bonus_cap": matching.BONUS_CAP
+        },
+        "parity": parity_checks(*make_dataset(*parse_scale(PARITY_SCALE), skew=skew, seed=seed)),
+        "results": []
+    }
+    if log:
+        log(f"parity: {report['parity']}")
+    for scale in scales:
+        data = make_dataset(*parse_scale(scale), skew=skew, seed=seed)
+        for name, items, best, median in benchmarks(*data, repeat=repeat):
+            report["results"].append({
+                "benchmark": name,
+                "scale": scale,
+                "items": items,
+                "min_s": best,
+                "median_s": median,
+                "per_item_us": best / max(items, 1) * 1e6
+            })
+            if log:
+                log(f"{scale:>20} {name:<36} {best:10.4f}s {best / max(items, 1) * 1e6:12.3f} us/item")
+    report["regressions"] = [
+        {"benchmark": r["benchmark"], "scale": r["scale"], "min_s": r["min_s"], "threshold_s": r["threshold_s"]}
+        for r in compare(report["results"], baseline or {}, tolerance)
+    ]
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scorers and matching paths on synthetic data.")
+    parser.add_argument("--scales", nargs="+", default=DEFAULT_SCALES, help="clients x maids x pairs (default: %(default)s)")
+    parser.add_argument("--skew", type=float, default=0.0, help="Zipf skew of category values (default: uniform)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark; the best is compared (default: %(default)s)")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="allowed slowdown vs baseline (default: %(default)s)")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    log = lambda msg: print(msg, file=sys.stderr)
+    report = run(args.scales, args.skew, args.seed, args.repeat, baseline, args.tolerance, log)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text)
+    else:
+        print(text)
+
+    failed = [name for name, ok in report["parity"].items() if not ok]
+    for name in failed:
+        log(f"PARITY FAILED: {name}")
+    for r in report["regressions"]:
+        log(f"REGRESSION: {r['benchmark']} @ {r['scale']}: {r['min_s']:.4f}s > {r['threshold_s']:.4f}s")
+    return 1 if failed or report["regressions"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""Load test for the matching service.
+
+    python -m load_test --serve maids.csv --rps 300 --duration 10
+    python -m load_test --url http://127.0.0.1:8765 --rps 500 --target-p99-ms 50
+
+Requests are sent open-loop at --rps from --concurrency threads, each on
+its own keep-alive connection, with synthetic client preferences. Latency
+is measured from when a request was due, not from when a thread got round to
+sending it, so a service that falls behind shows up in the percentiles.
+--serve starts `python -m match_service` on the maids file for the duration
+of the test. Prints a JSON report; the exit status is 1 if any request
+failed or p99 exceeds --target-p99-ms.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+from matching import CLIENT_SIGNATURE
+from synthetic import make_clients
+
+STARTUP_TIMEOUT_S = 120
+
+def client_rows(n, skew=0.5, seed=0):
+    clients = make_clients(n, skew, seed)
+    return [{c: row[c] for c in CLIENT_SIGNATURE} for row in clients.to_dict("records")]
+
+def wait_ready(url, timeout=STARTUP_TIMEOUT_S, process=None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError("match_service exited during startup")
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1) as response:
+                return json.load(response)
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            time.sleep(0.2)
+    raise RuntimeError(f"no answer from {url} within {timeout}s")
+
+def run_load(url, rps, duration, concurrency, rows, per_request=1, k=3):
+    """Send rps requests per second for duration seconds; returns (latencies_ms, errors, seconds)."""
+    target = urllib.parse.urlsplit(url)
+    n_requests = int(rps * duration)
+    bodies = [
+        json.dumps({"clients": [rows[(i * per_request + j) % len(rows)] for j in range(per_request)], "k": k}).encode()
+        for i in range(min(n_requests, len(rows)))
+    ]
+    latencies = np.full(n_requests, np.nan)
+    errors = []
+    counter = itertools.count()
+    start = time.perf_counter() + 0.1
+
+    def worker():
+        conn = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+        while (i := next(counter)) < n_requests:
+            due = start + i / rps
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                conn.request("POST", "/match", bodies[i % len(bodies)], {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors.append(f"HTTP {response.status}")
+                    continue
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(repr(e))
+                conn.close()
+                conn = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+                continue
+            latencies[i] = (time.perf_counter() - due) * 1000
+        conn.close()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return latencies[~np.isnan(latencies)], errors, elapsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the matching service.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="running service, e.g. http://127.0.0.1:8765")
+    target.add_argument("--serve", metavar="MAIDS", help="start match_service on this maids file for the test")
+    parser.add_argument("--port", type=int, default=8765, help="port for --serve (default: %(default)s)")
+    parser.add_argument("--rps", type=float, default=300, help="requests per second (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=10, help="seconds (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=32, help="sending threads (default: %(default)s)")
+    parser.add_argument("--clients-per-request", type=int, default=1, help="client rows per request (default: %(default)s)")
+    parser.add_argument("-k", type=int, default=3, help="maids per client (default: %(default)s)")
+    parser.add_argument("--target-p99-ms", type=float, default=None, help="fail if p99 latency is above this")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic clients (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.rps <= 0 or args.duration <= 0 or args.concurrency < 1 or args.clients_per_request < 1:
+        parser.error("--rps, --duration, --concurrency and --clients-per-request must be positive")
+
+    process = None
+    url = args.url.rstrip("/") if args.url else f"http://127.0.0.1:{args.port}"
+    if args.serve:
+        process = subprocess.Popen([sys.executable, "-m", "match_service", args.serve, "--port", str(args.port), "-q"])
+    try:
+        health = wait_ready(url, process=process)
+        rows = client_rows(max(1000, args.clients_per_request), seed=args.seed)
+        latencies, errors, elapsed = run_load(
+            url, args.rps, args.duration, args.concurrency, rows, args.clients_per_request, args.k
+        )
+        with urllib.request.urlopen(f"{url}/stats", timeout=5) as response:
+            server = json.load(response)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {
+        "maids": health["maids"],
+        "target_rps": args.rps,
+        "achieved_rps": len(latencies) / elapsed,
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "latency_ms": dict(zip(["p50", "p95", "p99", "max"], [
+            float(v) for v in (np.percentile(latencies, [50, 95, 99]).tolist() + [latencies.max()])
+        ])) if len(latencies) else {},
+        "server": {key: server[key] for key in ("latency_ms", "mean_batch_clients", "batches") if key in server}
+    }
+    print(json.dumps(report, indent=2))
+    p99 = report["latency_ms"].get("p99", np.inf)
+    failed = bool(errors) or (args.target_p99_ms is not None and p99 > args.target_p99_ms)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
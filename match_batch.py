@@ -0,0 +1,101 @@
+"""Headless batch scoring: every client's top-k maids, written to CSV.
+
+    python -m match_batch clients.csv maids.csv -o top_matches.csv -k 2 --workers 8
+
+Clients are split into shards that are scored on a process pool; shards are
+written in order as they finish, so the file is identical to a single-process
+run (--workers 1). Inputs may be CSV, Excel or Parquet; a single pair file
+can be passed as both clients and maids.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+
+import pandas as pd
+
+from matching import encode_masks, optimal_matches, read_dataset, unique_clients, unique_maids
+
+SHARD_CLIENTS = 2000
+
+# Each worker receives the maid pool once, through the pool initializer
+_maids = None
+
+def _init_worker(maids_df):
+    global _maids
+    _maids = maids_df
+
+def _score_shard(clients_df, k):
+    return optimal_matches(clients_df, _maids, k)
+
+def load_table(path):
+    path = Path(path)
+    if path.suffix == ".parquet":
+        frame = pd.read_parquet(path)
+    else:
+        frame, _ = read_dataset(path.read_bytes(), path.name)
+    encode_masks(frame)  # reject unknown preference tokens before any scoring
+    return frame
+
+def shard_clients(clients_df, size=SHARD_CLIENTS):
+    for start in range(0, len(clients_df), size):
+        yield clients_df.iloc[start:start + size].reset_index(drop=True)
+
+def run_batch(clients_df, maids_df, out, k=2, workers=None, shard_size=SHARD_CLIENTS, log=None):
+    """Score clients_df against maids_df and stream the top-k table to out.
+
+    Returns the number of rows written.
+    """
+    workers = workers or os.cpu_count() or 1
+    shards = shard_clients(clients_df, shard_size)
+    n_shards = -(-len(clients_df) // shard_size)
+    rows = 0
+    with open(out, "w", newline="", encoding="utf-8") as f:
+        if workers == 1:
+            pool, results = None, (optimal_matches(s, maids_df, k) for s in shards)
+        else:
+            pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(maids_df,))
+            results = pool.map(_score_shard, shards, repeat(k))
+        try:
+            for i, frame in enumerate(results):
+                frame.to_csv(f, header=i == 0, index=False)
+                rows += len(frame)
+                if log:
+                    log(f"shard {i + 1}/{n_shards}: {rows:,} rows")
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score every client against the maid pool and write top-k matches.")
+    parser.add_argument("clients", help="clients file (CSV, Excel or Parquet)")
+    parser.add_argument("maids", help="maids file (CSV, Excel or Parquet)")
+    parser.add_argument("-o", "--out", default="top_matches.csv", help="output CSV (default: %(default)s)")
+    parser.add_argument("-k", type=int, default=2, help="maids per client (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--shard-size", type=int, default=SHARD_CLIENTS, help="clients per shard (default: %(default)s)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no progress output")
+    args = parser.parse_args(argv)
+    if args.k < 1 or args.shard_size < 1 or (args.workers is not None and args.workers < 1):
+        parser.error("-k, --workers and --shard-size must be positive")
+
+    log = None if args.quiet else (lambda msg: print(msg, file=sys.stderr))
+    start = time.perf_counter()
+    try:
+        clients_df = unique_clients(load_table(args.clients))
+        maids_df = unique_maids(load_table(args.maids))
+    except ValueError as e:
+        sys.exit(str(e))
+    if log:
+        log(f"{len(clients_df):,} clients x {len(maids_df):,} maids")
+    rows = run_batch(clients_df, maids_df, args.out, args.k, args.workers, args.shard_size, log)
+    if log:
+        log(f"wrote {rows:,} rows to {args.out} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
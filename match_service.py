@@ -0,0 +1,253 @@
+"""Local HTTP/JSON matching service over a preloaded maid pool.
+
+    python -m match_service maids.csv --port 8765
+
+    POST /match   {"clients": [client_row, ...], "k": 3}
+                  -> {"matches": [[{"maid_id": "...", "score": 87.5}, ...], ...]}
+    GET  /stats   request counts, throughput, batch sizes and latency percentiles
+    GET  /health
+
+A client_row holds the Tab 3 fields (clientmts_household_type,
+clientmts_special_cases, clientmts_pet_type, clientmts_living_arrangement,
+clientmts_nationality_preference, clientmts_cuisine_preference). The maid
+pool is loaded and prepared once at startup. Requests go through a queue to
+a single scoring thread, which takes everything queued (waiting up to
+--batch-window-ms for more) and scores it in one query_maid_pool pass, so
+concurrent requests share the work. Results match Tab 3's "Find Best Maids".
+"""
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import perf
+from match_batch import load_table
+from matching import build_maid_pool, query_maid_pool, unique_maids, validate_client_row
+
+DEFAULT_PORT = 8765
+MAX_BATCH = 512          # clients scored per pass
+MAX_K = 50
+LATENCY_SAMPLES = 10_000  # most recent requests kept for percentiles
+RECENT_S = 10             # window for the recent throughput figure
+
+# -------------------------------
+# STATS
+# -------------------------------
+
+def new_stats():
+    return {
+        "lock": threading.Lock(),
+        "started": time.time(),
+        "requests": 0,
+        "clients": 0,
+        "errors": 0,
+        "batches": 0,
+        "batch_clients": 0,
+        "latency_ms": deque(maxlen=LATENCY_SAMPLES),
+        "finished": deque(maxlen=LATENCY_SAMPLES)
+    }
+
+def record_request(stats, n_clients, seconds, ok=True):
+    with stats["lock"]:
+        stats["requests"] += 1
+        stats["clients"] += n_clients if ok else 0
+        stats["errors"] += 0 if ok else 1
+        stats["latency_ms"].append(seconds * 1000)
+        stats["finished"].append(time.time())
+
+def stats_snapshot(stats):
+    """JSON-ready counters, throughput and latency percentiles."""
+    with stats["lock"]:
+        latency = np.array(stats["latency_ms"])
+        finished = np.array(stats["finished"])
+        uptime = time.time() - stats["started"]
+        snapshot = {
+            "uptime_s": uptime,
+            "requests": stats["requests"],
+            "clients": stats["clients"],
+            "errors": stats["errors"],
+            "batches": stats["batches"],
+            "mean_batch_clients": stats["batch_clients"] / stats["batches"] if stats["batches"] else 0.0,
+            "throughput_rps": stats["requests"] / uptime if uptime else 0.0,
+            "recent_rps": float((finished > time.time() - RECENT_S).sum()) / min(RECENT_S, max(uptime, 1e-9))
+        }
+    if len(latency):
+        p50, p95, p99 = np.percentile(latency, [50, 95, 99])
+        snapshot["latency_ms"] = {"p50": p50, "p95": p95, "p99": p99, "max": float(latency.max())}
+    snapshot["timers"] = perf.snapshot()["timers"]
+    return snapshot
+
+# -------------------------------
+# MICRO-BATCHING
+# -------------------------------
+
+def start_batcher(pool, stats, window_s=0.0, max_batch=MAX_BATCH):
+    """Start the scoring thread; returns submit(rows, k) -> (maid_idx, scores).
+
+    Each pass takes every queued request (and whatever arrives within
+    window_s of the first) up to max_batch clients, so under load requests
+    are scored together while a lone request is not held back.
+    """
+    pending = queue.Queue()
+
+    def take_batch():
+        batch = [pending.get()]
+        n = len(batch[0][0])
+        deadline = time.perf_counter() + window_s
+        while n < max_batch:
+            try:
+                item = pending.get(timeout=max(0.0, deadline - time.perf_counter())) if window_s else pending.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            n += len(item[0])
+        return batch
+
+    def run():
+        while True:
+            batch = take_batch()
+            rows = [row for item in batch for row in item[0]]
+            try:
+                maid_idx, scores = query_maid_pool(pool, rows, max(item[1] for item in batch))
+                error = None
+            except Exception as e:  # a failed pass answers its requests, the thread keeps serving
+                error = e
+            with stats["lock"]:
+                stats["batches"] += 1
+                stats["batch_clients"] += len(rows)
+            start = 0
+            for client_rows, k, done, slot in batch:
+                if error is None:
+                    end = start + len(client_rows)
+                    slot["result"] = (maid_idx[start:end, :k], scores[start:end, :k])
+                    start = end
+                else:
+                    slot["error"] = error
+                done.set()
+
+    threading.Thread(target=run, name="match-batcher", daemon=True).start()
+
+    def submit(rows, k):
+        done, slot = threading.Event(), {}
+        pending.put((rows, k, done, slot))
+        done.wait()
+        if "error" in slot:
+            raise slot["error"]
+        return slot["result"]
+    return submit
+
+# -------------------------------
+# HTTP
+# -------------------------------
+
+def make_handler(pool, submit, stats, max_k=MAX_K):
+    maid_id = pool["maid_id"]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so clients can reuse connections
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok", "maids": len(maid_id)})
+            elif self.path == "/stats":
+                self._send(200, stats_snapshot(stats))
+            else:
+                self._send(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            start = time.perf_counter()
+            if self.path != "/match":
+                self._send(404, {"error": f"unknown path {self.path}"})
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not isinstance(request, dict):
+                    raise ValueError("expected a JSON object")
+                rows, k = request.get("clients"), request.get("k", 3)
+                if not isinstance(rows, list) or not rows:
+                    raise ValueError('expected a non-empty "clients" list')
+                if not isinstance(k, int) or not 1 <= k <= max_k:
+                    raise ValueError(f'"k" must be an integer from 1 to {max_k}')
+                for i, row in enumerate(rows):
+                    try:
+                        validate_client_row(row)
+                    except ValueError as e:
+                        raise ValueError(f"clients[{i}]: {e}") from None
+            except ValueError as e:
+                record_request(stats, 0, time.perf_counter() - start, ok=False)
+                self._send(400, {"error": str(e)})
+                return
+            try:
+                idx, scores = submit(rows, k)
+            except Exception as e:
+                record_request(stats, 0, time.perf_counter() - start, ok=False)
+                self._send(500, {"error": str(e)})
+                return
+            matches = [
+                [{"maid_id": str(maid_id[i]), "score": float(s)} for i, s in zip(row_idx, row_scores)]
+                for row_idx, row_scores in zip(idx, scores)
+            ]
+            record_request(stats, len(rows), time.perf_counter() - start)
+            self._send(200, {"matches": matches})
+
+    return Handler
+
+def serve(maids_df, host="127.0.0.1", port=DEFAULT_PORT, window_s=0.0, max_batch=MAX_BATCH, max_k=MAX_K):
+    """A ready (not yet serving) HTTP server over maids_df; call serve_forever() on it."""
+    pool = build_maid_pool(maids_df)
+    stats = new_stats()
+    submit = start_batcher(pool, stats, window_s, max_batch)
+    server = ThreadingHTTPServer((host, port), make_handler(pool, submit, stats, max_k))
+    server.daemon_threads = True
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve top-k maid matches over HTTP/JSON.")
+    parser.add_argument("maids", help="maids file (CSV, Excel or Parquet)")
+    parser.add_argument("--host", default="127.0.0.1", help="bind address (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port (default: %(default)s)")
+    parser.add_argument("--batch-window-ms", type=float, default=0.0,
+                        help="wait this long for more requests before scoring a batch (default: %(default)s)")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="clients per scoring pass (default: %(default)s)")
+    parser.add_argument("--max-k", type=int, default=MAX_K, help="largest k a request may ask for (default: %(default)s)")
+    parser.add_argument("-q", "--quiet", action="store_true", help="no startup output")
+    args = parser.parse_args(argv)
+    if args.max_batch < 1 or args.max_k < 1 or args.batch_window_ms < 0:
+        parser.error("--max-batch and --max-k must be positive and --batch-window-ms not negative")
+
+    start = time.perf_counter()
+    try:
+        maids_df = unique_maids(load_table(args.maids))
+    except ValueError as e:
+        sys.exit(str(e))
+    server = serve(maids_df, args.host, args.port, args.batch_window_ms / 1000, args.max_batch, args.max_k)
+    if not args.quiet:
+        print(f"{len(maids_df):,} maids ready in {time.perf_counter() - start:.1f}s; "
+              f"serving on http://{args.host}:{server.server_port}", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
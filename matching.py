@@ -0,0 +1,1960 @@
+"""Client–maid matching core: scoring, matching and ingestion.
+
+Kept free of Streamlit so batch jobs can import it; app.py is the UI.
+"""
+import functools
+import gzip
+import hashlib
+import io
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+import pandas as pd
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+
+import perf
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+THEME_WEIGHTS = {
+    "household_kids": 9,
+    "special_cases": 8,
+    "pets": 8,
+    "living": 9,
+    "nationality": 8,
+    "cuisine": 6
+}
+
+BONUS_CAP = 10  # max total bonus %
+
+# -------------------------------
+# HELPER FUNCTIONS WITH EXPLANATIONS
+# -------------------------------
+
+def score_household_kids(client, maid, exp):
+    w = THEME_WEIGHTS["household_kids"]
+    if client == "unspecified":
+        return None, "Neutral: client did not specify household type"
+    if client == "baby":
+        if maid in ["refuses_baby", "refuses_baby_and_kids"]:
+            if exp in ["lessthan2", "above2", "both"]:
+                return int(w * 1.2), "Bonus: maid has kids experience despite refusal (baby)"
+            return 0, "Mismatch: maid refuses baby care"
+        elif exp in ["lessthan2", "above2", "both"]:
+            return int(w * 1.2), "Bonus: maid has kids experience, client has baby"
+        else:
+            return w, "Match: client has baby, maid accepts"
+    if client == "many_kids":
+        if maid in ["refuses_many_kids", "refuses_baby_and_kids"]:
+            if exp in ["lessthan2", "above2", "both"]:
+                return int(w * 1.2), "Bonus: maid has kids experience despite refusal (many kids)"
+            return 0, "Mismatch: maid refuses many kids"
+        elif exp in ["lessthan2", "above2", "both"]:
+            return int(w * 1.2), "Bonus: maid has kids experience, client has many kids"
+        else:
+            return w, "Match: client has many kids, maid accepts"
+    if client == "baby_and_kids":
+        if maid in ["refuses_baby_and_kids", "refuses_baby", "refuses_many_kids"]:
+            if exp in ["lessthan2", "above2", "both"]:
+                return int(w * 1.2), "Bonus: maid has kids experience despite refusal (baby_and_kids)"
+            return 0, "Mismatch: maid refuses baby_and_kids"
+        elif exp in ["lessthan2", "above2", "both"]:
+            return int(w * 1.2), "Bonus: maid has kids experience, client has baby_and_kids"
+        else:
+            return w, "Match: client has baby_and_kids, maid accepts"
+    return None, "Neutral"
+
+def score_special_cases(client, maid):
+    w = THEME_WEIGHTS["special_cases"]
+    if client == "unspecified":
+        return None, "Neutral: client did not specify special cases"
+    if client == "elderly":
+        if maid in ["elderly_experienced", "elderly_and_special"]:
+            return w, "Match: elderly supported"
+        elif maid == "special_needs":
+            return int(w * 0.6), "Partial: client elderly, maid only has special_needs"
+    if client == "special_needs":
+        if maid in ["special_needs", "elderly_and_special"]:
+            return w, "Match: special needs supported"
+        elif maid == "elderly_experienced":
+            return int(w * 0.6), "Partial: client special_needs, maid only elderly"
+    if client == "elderly_and_special":
+        if maid == "elderly_and_special":
+            return w, "Perfect match: elderly + special needs"
+        elif maid in ["elderly_experienced", "special_needs"]:
+            return int(w * 0.6), "Partial: maid covers only one"
+    return None, "Neutral"
+
+def score_pets(client, maid, handling):
+    w = THEME_WEIGHTS["pets"]
+    if client == "unspecified":
+        return None, "Neutral: client did not specify pets"
+    if client == "cat":
+        if maid in ["refuses_cat", "refuses_both_pets"]:
+            if handling in ["cats", "both"]:
+                return int(w * 1.2), "Bonus: maid reports cat handling despite refusal"
+            return 0, "Mismatch: maid refuses cats"
+        elif handling in ["cats", "both"]:
+            return int(w * 1.2), "Bonus: maid has cat handling experience"
+        else:
+            return w, "Match: cats allowed"
+    if client == "dog":
+        if maid in ["refuses_dog", "refuses_both_pets"]:
+            if handling in ["dogs", "both"]:
+                return int(w * 1.2), "Bonus: maid reports dog handling despite refusal"
+            return 0, "Mismatch: maid refuses dogs"
+        elif handling in ["dogs", "both"]:
+            return int(w * 1.2), "Bonus: maid has dog handling experience"
+        else:
+            return w, "Match: dogs allowed"
+    if client == "both":
+        if maid in ["refuses_both_pets", "refuses_cat", "refuses_dog"]:
+            if handling in ["cats", "dogs", "both"]:
+                return int(w * 1.2), "Bonus: maid reports pet handling despite refusal"
+            return 0, "Mismatch: maid refuses one or both pets"
+        elif handling == "both":
+            return int(w * 1.2), "Bonus: maid prefers handling both cats & dogs"
+        else:
+            return w, "Match: both cats & dogs allowed"
+    return None, "Neutral"
+
+def score_living(client, maid):
+    w = THEME_WEIGHTS["living"]
+    if client == "unspecified":
+        return None, "Neutral: client did not specify living arrangement"
+
+    # Client requires private room
+    if client in ["private_room", "live_out+private_room"]:
+        return w, "Match: private room requirement satisfied"
+
+    # Client requires Abu Dhabi posting
+    if client in ["private_room+abu_dhabi", "live_out+private_room+abu_dhabi"]:
+        if isinstance(maid, str) and "refuses_abu_dhabi" in maid:
+            return 0, "Mismatch: maid refuses Abu Dhabi"
+        else:
+            return w, "Match: Abu Dhabi posting acceptable"
+
+    return None, "Neutral"
+
+def score_nationality(client, maid):
+    w = THEME_WEIGHTS["nationality"]
+    if client == "any":
+        return w, f"Match: client accepts any nationality, maid is {maid}"
+    mapping = {
+        "filipina": "filipina",
+        "ethiopian maid": "ethiopian",
+        "west african nationality": "west_african"
+    }
+    prefs = client.split("+") if isinstance(client, str) else []
+    prefs = [mapping.get(p.strip(), p.strip()) for p in prefs]
+    if maid in prefs:
+        return w, f"Match: client prefers {client}, maid is {maid}"
+    if maid == "indian":
+        return 0, "Mismatch: client does not accept indian nationality"
+    return 0, f"Mismatch: client prefers {client}, maid is {maid}"
+
+def score_cuisine(client, maid_flags):
+    w = THEME_WEIGHTS["cuisine"]
+    if client == "unspecified" or not isinstance(client, str):
+        return None, "Neutral: client did not specify cuisine"
+    prefs = client.split("+")
+    prefs = [p.strip() for p in prefs]
+    matches = 0
+    if "lebanese" in prefs and maid_flags.get("maid_cooking_lebanese", 0) == 1:
+        matches += 1
+    if "khaleeji" in prefs and maid_flags.get("maid_cooking_khaleeji", 0) == 1:
+        matches += 1
+    if "international" in prefs and maid_flags.get("maid_cooking_international", 0) == 1:
+        matches += 1
+    if matches == 0:
+        return 0, "Mismatch: no requested cuisines matched"
+    if matches == len(prefs):
+        return w, "Perfect match: all cuisines covered"
+    if len(prefs) == 2 and matches == 1:
+        return int(w * 0.6), "Partial match: 1 of 2 cuisines covered"
+    if len(prefs) == 3:
+        if matches == 2:
+            return int(w * 0.8), "Partial match: 2 of 3 cuisines covered"
+        if matches == 1:
+            return int(w * 0.5), "Weak partial match: 1 of 3 cuisines covered"
+    return int(w * (matches / len(prefs))), f"Partial match: {matches} of {len(prefs)} cuisines covered"
+
+def score_bonuses(row):
+    bonuses, explanations = 0, []
+    langs = []
+    if row.get("maidspeaks_arabic", 0) == 1:
+        bonuses += 1; langs.append("Arabic")
+    if row.get("maidspeaks_english", 0) == 1:
+        bonuses += 1; langs.append("English")
+    if row.get("maidspeaks_french", 0) == 1:
+        bonuses += 1; langs.append("French")
+    if langs:
+        explanations.append("Bonus: speaks " + ", ".join(langs))
+    exp = row.get("years_of_experience", 0)
+    if exp >= 5:
+        bonuses += 2; explanations.append(f"Bonus: {exp} years experience")
+    elif exp >= 2:
+        bonuses += 1; explanations.append(f"Bonus: {exp} years experience")
+    edu = row.get("maidpref_education", "unspecified")
+    if edu in ["school", "both", "university"]:
+        bonuses += 1; explanations.append(f"Bonus: education = {edu}")
+    pers = row.get("maidpref_personality", "unspecified")
+    if isinstance(pers, str) and pers != "unspecified":
+        bonuses += 1; explanations.append(f"Bonus: personality = {pers.replace('+', ', ')}")
+    travel = row.get("maidpref_travel", "unspecified")
+    if travel == "travel":
+        bonuses += 1; explanations.append("Bonus: open to travel")
+    elif travel in ["relocate", "travel_and_relocate"]:
+        bonuses += 2; explanations.append("Bonus: open to travel & relocation")
+    smoking = row.get("maidpref_smoking", "unspecified")
+    if smoking == "non_smoker":
+        bonuses += 1; explanations.append("Bonus: non-smoker")
+    return min(bonuses, BONUS_CAP), explanations
+
+def calculate_score(row):
+    theme_scores = {}
+    scores, max_weights = [], []
+    s, r = score_household_kids(row["clientmts_household_type"], row["maidmts_household_type"], row["maidpref_kids_experience"])
+    theme_scores["Household & Kids Reason"] = r
+    if s is not None: scores.append(s); max_weights.append(THEME_WEIGHTS["household_kids"])
+    s, r = score_special_cases(row["clientmts_special_cases"], row["maidpref_caregiving_profile"])
+    theme_scores["Special Cases Reason"] = r
+    if s is not None: scores.append(s); max_weights.append(THEME_WEIGHTS["special_cases"])
+    s, r = score_pets(row["clientmts_pet_type"], row["maidmts_pet_type"], row["maidpref_pet_handling"])
+    theme_scores["Pets Reason"] = r
+    if s is not None: scores.append(s); max_weights.append(THEME_WEIGHTS["pets"])
+    s, r = score_living(row["clientmts_living_arrangement"], row["maidmts_living_arrangement"])
+    theme_scores["Living Reason"] = r
+    if s is not None: scores.append(s); max_weights.append(THEME_WEIGHTS["living"])
+    s, r = score_nationality(row["clientmts_nationality_preference"], row["maid_grouped_nationality"])
+    theme_scores["Nationality Reason"] = r
+    if s is not None: scores.append(s); max_weights.append(THEME_WEIGHTS["nationality"])
+    maid_flags = {
+        "maid_cooking_lebanese": row["maid_cooking_lebanese"],
+        "maid_cooking_khaleeji": row["maid_cooking_khaleeji"],
+        "maid_cooking_international": row["maid_cooking_international"]
+    }
+    s, r = score_cuisine(row["clientmts_cuisine_preference"], maid_flags)
+    theme_scores["Cuisine Reason"] = r
+    if s is not None: scores.append(s); max_weights.append(THEME_WEIGHTS["cuisine"])
+    if not scores:
+        return 0, "Neutral", theme_scores, []
+    base_score = sum(scores) / sum(max_weights) * 100
+    bonus, bonus_reasons = score_bonuses(row)
+    final_score = min(base_score + bonus, 100)
+    return round(final_score, 1), theme_scores, bonus_reasons
+
+# Per-pair helpers; perf.instrument(matching, SCALAR_HELPERS) times them
+SCALAR_HELPERS = [
+    "score_household_kids", "score_special_cases", "score_pets", "score_living",
+    "score_nationality", "score_cuisine", "score_bonuses", "calculate_score"
+]
+
+# -------------------------------
+# VECTORIZED SCORING
+# -------------------------------
+# Batch counterparts of the score_* helpers above. They take whole columns and
+# return one value per row, with NaN standing in for a neutral (None) theme.
+# The scalar helpers remain the reference implementation; these must agree
+# with them exactly. Each theme is split into a weight-free multiplier (1.0 for
+# a match, 1.2, 0.6, ... for bonuses and partial matches) and `weighted`, so
+# scores can be recomputed for other weights without re-reading the fields.
+
+KIDS_EXPERIENCE = ["lessthan2", "above2", "both"]
+NATIONALITY_MAPPING = {
+    "filipina": "filipina",
+    "ethiopian maid": "ethiopian",
+    "west african nationality": "west_african"
+}
+CUISINE_FLAGS = {
+    "lebanese": "maid_cooking_lebanese",
+    "khaleeji": "maid_cooking_khaleeji",
+    "international": "maid_cooking_international"
+}
+THEME_COLUMNS = {
+    "household_kids": ["clientmts_household_type", "maidmts_household_type", "maidpref_kids_experience"],
+    "special_cases": ["clientmts_special_cases", "maidpref_caregiving_profile"],
+    "pets": ["clientmts_pet_type", "maidmts_pet_type", "maidpref_pet_handling"],
+    "living": ["clientmts_living_arrangement", "maidmts_living_arrangement"],
+    "nationality": ["clientmts_nationality_preference", "maid_grouped_nationality"],
+    "cuisine": ["clientmts_cuisine_preference"] + list(CUISINE_FLAGS.values())
+}
+BONUS_DEFAULTS = {
+    "maidspeaks_arabic": 0,
+    "maidspeaks_english": 0,
+    "maidspeaks_french": 0,
+    "years_of_experience": 0,
+    "maidpref_education": "unspecified",
+    "maidpref_personality": "unspecified",
+    "maidpref_travel": "unspecified",
+    "maidpref_smoking": "unspecified"
+}
+
+def _values(col):
+    return col.to_numpy(dtype=object) if isinstance(col, pd.Series) else np.asarray(col, dtype=object)
+
+def _map_unique(col, fn):
+    # Evaluate fn once per distinct value and broadcast back to the rows;
+    # a Series is factorized directly, which skips the object conversion
+    col = col if isinstance(col, pd.Series) else _values(col)
+    codes, uniques = pd.factorize(col, use_na_sentinel=False)
+    return np.asarray([fn(u) for u in uniques])[codes]
+
+def _isin(col, options):
+    return np.isin(_values(col), options)
+
+def _eq(col, value):
+    return _values(col) == value
+
+def household_kids_multipliers(client, maid, exp):
+    has_exp = _isin(exp, KIDS_EXPERIENCE)
+    refusals = {
+        "baby": ["refuses_baby", "refuses_baby_and_kids"],
+        "many_kids": ["refuses_many_kids", "refuses_baby_and_kids"],
+        "baby_and_kids": ["refuses_baby_and_kids", "refuses_baby", "refuses_many_kids"]
+    }
+    out = np.full(len(has_exp), np.nan)
+    for kind, refused in refusals.items():
+        is_kind = _eq(client, kind)
+        out[is_kind] = np.select(
+            [has_exp[is_kind], _isin(maid, refused)[is_kind]],
+            [1.2, 0.0],
+            default=1.0
+        )
+    return out
+
+def special_cases_multipliers(client, maid):
+    cases = {
+        "elderly": (["elderly_experienced", "elderly_and_special"], ["special_needs"]),
+        "special_needs": (["special_needs", "elderly_and_special"], ["elderly_experienced"]),
+        "elderly_and_special": (["elderly_and_special"], ["elderly_experienced", "special_needs"])
+    }
+    conditions, choices = [], []
+    for kind, (full, partial) in cases.items():
+        is_kind = _eq(client, kind)
+        conditions += [is_kind & _isin(maid, full), is_kind & _isin(maid, partial)]
+        choices += [1.0, 0.6]
+    return np.select(conditions, choices, default=np.nan)
+
+def pets_multipliers(client, maid, handling):
+    cases = {
+        # client: (maid refusals, handling that overrides a refusal, handling that earns a bonus)
+        "cat": (["refuses_cat", "refuses_both_pets"], ["cats", "both"], ["cats", "both"]),
+        "dog": (["refuses_dog", "refuses_both_pets"], ["dogs", "both"], ["dogs", "both"]),
+        "both": (["refuses_both_pets", "refuses_cat", "refuses_dog"], ["cats", "dogs", "both"], ["both"])
+    }
+    out = np.full(len(_values(client)), np.nan)
+    for kind, (refused, override, bonus) in cases.items():
+        is_kind = _eq(client, kind)
+        refuses = _isin(maid, refused)[is_kind]
+        out[is_kind] = np.select(
+            [refuses & _isin(handling, override)[is_kind], refuses, _isin(handling, bonus)[is_kind]],
+            [1.2, 0.0, 1.2],
+            default=1.0
+        )
+    return out
+
+def living_multipliers(client, maid):
+    client = token_masks(client, "clientmts_living_arrangement")
+    refuses_ad = (token_masks(maid, "maidmts_living_arrangement")
+                  & token_mask("maidmts_living_arrangement", "refuses_abu_dhabi")) != 0
+    # Tokens are in vocabulary order, so these are exactly the values
+    # score_living lists: private_room with and without live_out, +abu_dhabi
+    private = (client & token_mask("clientmts_living_arrangement", "private_room")) != 0
+    abu_dhabi = private & ((client & token_mask("clientmts_living_arrangement", "abu_dhabi")) != 0)
+    return np.select([abu_dhabi & refuses_ad, abu_dhabi, private], [0.0, 1.0, 1.0], default=np.nan)
+
+def nationality_multipliers(client, maid):
+    accepted = (token_masks(client, "clientmts_nationality_preference")
+                & token_masks(maid, "maid_grouped_nationality")) != 0
+    return np.where(accepted | _eq(client, "any"), 1.0, 0.0)
+
+# Set bits of every cuisine mask (np.bitwise_count needs NumPy 2)
+CUISINE_MASK_BITS = np.array([bin(mask).count("1") for mask in range(1 << len(CUISINE_FLAGS))])
+
+def cuisine_multipliers(client, lebanese, khaleeji, international):
+    # score_cuisine counts listed tokens with repeats but matches each cuisine once
+    n_prefs = token_counts(client, "clientmts_cuisine_preference")
+    client = token_masks(client, "clientmts_cuisine_preference")
+    unspecified = client == 0
+    matches = CUISINE_MASK_BITS[client & cooking_masks(lebanese, khaleeji, international)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        proportional = matches / n_prefs
+    return np.select(
+        [unspecified, matches == 0, matches == n_prefs,
+         (n_prefs == 2) & (matches == 1),
+         (n_prefs == 3) & (matches == 2),
+         (n_prefs == 3) & (matches == 1)],
+        [np.nan, 0.0, 1.0, 0.6, 0.8, 0.5],
+        default=proportional
+    )
+
+def weighted(multipliers, weight):
+    """Theme score from its multiplier: int(weight * multiplier) as in the score_* helpers."""
+    return np.trunc(weight * np.asarray(multipliers, dtype=float))
+
+def batch_household_kids(client, maid, exp):
+    return weighted(household_kids_multipliers(client, maid, exp), THEME_WEIGHTS["household_kids"])
+
+def batch_special_cases(client, maid):
+    return weighted(special_cases_multipliers(client, maid), THEME_WEIGHTS["special_cases"])
+
+def batch_pets(client, maid, handling):
+    return weighted(pets_multipliers(client, maid, handling), THEME_WEIGHTS["pets"])
+
+def batch_living(client, maid):
+    return weighted(living_multipliers(client, maid), THEME_WEIGHTS["living"])
+
+def batch_nationality(client, maid):
+    return weighted(nationality_multipliers(client, maid), THEME_WEIGHTS["nationality"])
+
+def batch_cuisine(client, lebanese, khaleeji, international):
+    return weighted(cuisine_multipliers(client, lebanese, khaleeji, international), THEME_WEIGHTS["cuisine"])
+
+def batch_bonuses(df):
+    """Per-row bonus components and the capped total, mirroring score_bonuses."""
+    def col(name):
+        return df[name] if name in df else pd.Series(BONUS_DEFAULTS[name], index=df.index)
+
+    languages = sum(
+        (_values(col(c)) == 1).astype(int)
+        for c in ["maidspeaks_arabic", "maidspeaks_english", "maidspeaks_french"]
+    )
+    exp = pd.to_numeric(col("years_of_experience"), errors="coerce").to_numpy(dtype=float)
+    travel = col("maidpref_travel")
+    bonuses = pd.DataFrame({
+        "bonus_languages": languages,
+        "bonus_experience": np.select([exp >= 5, exp >= 2], [2, 1], default=0),
+        "bonus_education": _isin(col("maidpref_education"), ["school", "both", "university"]).astype(int),
+        "bonus_personality": (token_masks(col("maidpref_personality"), "maidpref_personality") != 0).astype(int),
+        "bonus_travel": np.select(
+            [_eq(travel, "travel"), _isin(travel, ["relocate", "travel_and_relocate"])], [1, 2], default=0
+        ),
+        "bonus_smoking": _eq(col("maidpref_smoking"), "non_smoker").astype(int)
+    }, index=df.index)
+    bonuses["bonus"] = np.minimum(bonuses.sum(axis=1).to_numpy(), BONUS_CAP)
+    return bonuses
+
+THEME_MULTIPLIERS = {
+    "household_kids": household_kids_multipliers,
+    "special_cases": special_cases_multipliers,
+    "pets": pets_multipliers,
+    "living": living_multipliers,
+    "nationality": nationality_multipliers,
+    "cuisine": cuisine_multipliers
+}
+
+THEME_SCORERS = {
+    "household_kids": batch_household_kids,
+    "special_cases": batch_special_cases,
+    "pets": batch_pets,
+    "living": batch_living,
+    "nationality": batch_nationality,
+    "cuisine": batch_cuisine
+}
+
+def batch_theme_scores(df):
+    """One column per theme; NaN marks a neutral theme (scalar helper returned None)."""
+    scores = {}
+    for theme, scorer in THEME_SCORERS.items():
+        with perf.timer(f"theme.{theme}"):
+            scores[theme] = scorer(*(df[c] for c in THEME_COLUMNS[theme]))
+    return pd.DataFrame(scores, index=df.index)
+
+# Tables reach tens of MB at the largest what-if weights, so only the
+# configured weights and one what-if setting are kept.
+@functools.lru_cache(maxsize=2)
+def _final_score_table(weights, bonus_cap):
+    # Every theme score is a small int, so Final Score % only depends on
+    # (sum of scores, sum of active weights, bonus). Tabulate it once with
+    # Python's round(); np.round agrees except next to a ...x5 tie, so only
+    # those cells go through round(). One bonus at a time keeps the
+    # temporaries to a slice of the table.
+    max_total = sum(max(w, int(w * 1.2)) for _, w in weights)
+    max_weights = sum(w for _, w in weights)
+    total, weight = np.ogrid[:max_total + 1, 1:max_weights + 1]
+    ratio = total / weight * 100
+    table = np.zeros((max_total + 1, max_weights + 1, bonus_cap + 1))
+    for bonus in range(bonus_cap + 1):
+        raw = np.minimum(ratio + bonus, 100)
+        rounded = np.round(raw, 1)
+        tens = raw * 10
+        for i in zip(*np.nonzero(np.abs(tens - np.floor(tens) - 0.5) < 1e-6)):
+            rounded[i] = round(float(raw[i]), 1)
+        table[:, 1:, bonus] = rounded
+    return table
+
+def _weights_key(weights=None, bonus_cap=None):
+    weights = THEME_WEIGHTS if weights is None else weights
+    return tuple((t, int(weights[t])) for t in THEME_WEIGHTS), int(BONUS_CAP if bonus_cap is None else bonus_cap)
+
+def final_score_table(weights=None, bonus_cap=None):
+    """Final Score % by [sum of theme scores, sum of active weights, capped bonus]."""
+    return _final_score_table(*_weights_key(weights, bonus_cap))
+
+def combine_scores(theme_scores, bonus):
+    """Final Score % from theme scores and capped bonus, rounded exactly like calculate_score."""
+    weights = np.array([THEME_WEIGHTS[t] for t in theme_scores.columns])
+    values = theme_scores.to_numpy(dtype=float)
+    active = ~np.isnan(values)
+    total = np.where(active, values, 0).sum(axis=1).astype(int)
+    max_total = (active * weights).sum(axis=1)
+    return final_score_table()[total, max_total, np.asarray(bonus, dtype=int)]
+
+def score_frame(df):
+    """Vectorized calculate_score over every row of df.
+
+    Returns a DataFrame aligned with df holding "Final Score %", one column per
+    theme (NaN when neutral) and the bonus components plus the capped "bonus".
+    """
+    themes = batch_theme_scores(df)
+    with perf.timer("score.bonuses"):
+        bonuses = batch_bonuses(df)
+    with perf.timer("score.combine"):
+        final = pd.Series(combine_scores(themes, bonuses["bonus"]), index=df.index, name="Final Score %")
+    perf.count("score.rows", len(df))
+    return pd.concat([final, themes, bonuses], axis=1)
+
+# -------------------------------
+# TOKEN MASKS
+# -------------------------------
+# The "+"-joined preference fields are encoded once per distinct value as a
+# bitmask over a fixed vocabulary, so matching is a bitwise AND and counting
+# is a popcount. A token outside the vocabulary would silently score as a
+# mismatch, so encoding rejects it; ingestion encodes every upload up front.
+# Missing values encode as no tokens, which scores like the "none" value.
+# Fields the scorers only search for one token, or only test for a value,
+# keep an open vocabulary and accept anything, and so does the maid's
+# nationality: only the client's preference lists tokens to check.
+
+# What score_nationality can match: its aliases' targets plus "indian", the
+# one other nationality it names. Other maid nationalities get no bit.
+NATIONALITY_VOCAB = ["filipina", "ethiopian", "west_african", "indian"]
+CUISINE_VOCAB = list(CUISINE_FLAGS)
+
+# column -> (vocabulary, whole value meaning "no tokens", whole value meaning "every token")
+MASK_FIELDS = {
+    "clientmts_nationality_preference": (NATIONALITY_VOCAB, None, "any"),
+    "maid_grouped_nationality": (NATIONALITY_VOCAB, None, None),
+    "clientmts_cuisine_preference": (CUISINE_VOCAB, "unspecified", None),
+    "clientmts_living_arrangement": (["live_out", "private_room", "abu_dhabi"], "unspecified", None),
+    "maidmts_living_arrangement": (["refuses_live_out", "refuses_abu_dhabi"], "unspecified", None),
+    "maidpref_personality": ([], "unspecified", None)
+}
+TOKEN_ALIASES = {"clientmts_nationality_preference": NATIONALITY_MAPPING}
+# Open fields reject nothing: a vocabulary token sets its bit wherever it
+# occurs in the value (score_living tests substrings), and with no vocabulary
+# any value sets bit 0 (score_bonuses only tests for a personality).
+OPEN_FIELDS = {"maidmts_living_arrangement", "maidpref_personality"}
+# Compared as a whole value by score_nationality: a value that is not exactly
+# one vocabulary token encodes as 0, a plain mismatch, and is not rejected.
+SINGLE_TOKEN = {"maid_grouped_nationality"}
+ORDERED_TOKENS = {"clientmts_living_arrangement"}  # score_living compares the joined string
+
+def _token_rules():
+    # Everything above that decides how a preference value is read, for hashing
+    return {
+        "mask_fields": MASK_FIELDS,
+        "token_aliases": TOKEN_ALIASES,
+        "open_fields": sorted(OPEN_FIELDS),
+        "single_token": sorted(SINGLE_TOKEN),
+        "ordered_tokens": sorted(ORDERED_TOKENS)
+    }
+
+@functools.lru_cache(maxsize=4096)
+def token_mask(column, value):
+    """Bitmask of one field value; raises ValueError naming an unknown token.
+
+    Values the scalar helpers compare as a whole encode as 0 unless written
+    exactly as they expect: any maid_grouped_nationality other than one
+    vocabulary token, and client living tokens out of vocabulary order,
+    repeated or padded.
+    """
+    vocab, none, every = MASK_FIELDS[column]
+    if not isinstance(value, str):
+        if pd.isna(value):
+            return 0
+        value = str(value)
+    if value == none:
+        return 0
+    if value == every:
+        return (1 << len(vocab)) - 1
+    if column in OPEN_FIELDS:
+        return sum(1 << i for i, t in enumerate(vocab) if t in value) if vocab else 1
+    if column in SINGLE_TOKEN:
+        return 1 << vocab.index(value) if value in vocab else 0
+    aliases = TOKEN_ALIASES.get(column, {})
+    tokens = [aliases.get(t.strip(), t.strip()) for t in value.split("+")]
+    unknown = [t for t in tokens if t not in vocab]
+    if unknown:
+        allowed = ", ".join(list(aliases) + [v for v in vocab if v not in aliases] + [v for v in (none, every) if v])
+        raise ValueError(f"{column}: unknown token {unknown[0]!r} in {value!r}; expected {allowed}")
+    mask = sum(1 << p for p in {vocab.index(t) for t in tokens})
+    if column in ORDERED_TOKENS and value != "+".join(t for i, t in enumerate(vocab) if mask >> i & 1):
+        return 0
+    return mask
+
+@functools.lru_cache(maxsize=4096)
+def token_count(column, value):
+    """Number of "+"-joined tokens in a value, repeats included; 0 for missing or the none value."""
+    if not isinstance(value, str) or value == MASK_FIELDS[column][1]:
+        return 0
+    return len(value.split("+"))
+
+def token_masks(col, column):
+    """token_mask for every row of col, evaluated once per distinct value (uint8)."""
+    return _map_unique(col, lambda v: token_mask(column, v)).astype(np.uint8)
+
+def token_counts(col, column):
+    """token_count for every row of col, evaluated once per distinct value."""
+    return _map_unique(col, lambda v: token_count(column, v)).astype(np.int64)
+
+def cooking_masks(lebanese, khaleeji, international):
+    """Cuisine bitmask of the maids' cooking flags, over CUISINE_VOCAB."""
+    return ((_values(lebanese) == 1) * 1 | (_values(khaleeji) == 1) * 2
+            | (_values(international) == 1) * 4).astype(np.uint8)
+
+def encode_masks(df):
+    """Bitmask columns for every mask field in df, plus "maid_cooking" from the flags.
+
+    Raises one ValueError listing every value with an unknown token and how
+    many rows hold it.
+    """
+    masks, errors = {}, []
+    for column in MASK_FIELDS:
+        if column not in df:
+            continue
+        values = df[column].value_counts(dropna=False)
+        bad = []
+        for value, n in values[values > 0].items():
+            try:
+                token_mask(column, value)
+            except ValueError as e:
+                bad.append(f"{e} ({n:,} row{'s' if n != 1 else ''})")
+        if bad:
+            errors += bad
+        else:
+            masks[column] = token_masks(df[column], column)
+    if errors:
+        raise ValueError("Unrecognised preference values:\n" + "\n".join(errors))
+    if all(c in df for c in CUISINE_FLAGS.values()):
+        masks["maid_cooking"] = cooking_masks(*(df[c] for c in CUISINE_FLAGS.values()))
+    return pd.DataFrame(masks, index=df.index)
+
+# -------------------------------
+# PROFILE SIGNATURES
+# -------------------------------
+# Scores only depend on a handful of categorical fields, and many clients and
+# maids share the exact same values for all of them. Grouping rows by that
+# signature lets every distinct profile pair be scored once.
+
+CLIENT_SIGNATURE = list(dict.fromkeys(
+    c for cols in THEME_COLUMNS.values() for c in cols if c.startswith("client")
+))
+MAID_THEME_SIGNATURE = list(dict.fromkeys(
+    c for cols in THEME_COLUMNS.values() for c in cols if not c.startswith("client")
+))
+MAID_SIGNATURE = MAID_THEME_SIGNATURE + list(BONUS_DEFAULTS)
+
+def _factorize_rows(frame):
+    """Codes per row and the distinct rows of frame, in first-seen order."""
+    codes = frame.groupby(list(frame.columns), sort=False, dropna=False, observed=True).ngroup().to_numpy()
+    return codes, frame.drop_duplicates().reset_index(drop=True)
+
+def profile_signatures(df, signature):
+    """Map each row of df to its distinct scoring profile.
+
+    Returns (codes, profiles): profiles holds one row per distinct signature and
+    codes[i] is the profile of row i. Optional signature columns that are missing
+    from df are skipped, as calculate_score falls back to defaults for them.
+    """
+    return _factorize_rows(df[[c for c in signature if c in df]])
+
+def maid_score_profiles(maids_df):
+    """Distinct maid profiles as far as the final score is concerned.
+
+    Bonus fields only matter through the capped bonus, so they are collapsed
+    into a single "bonus" column before grouping. Returns (codes, profiles).
+    """
+    fields = maids_df[MAID_THEME_SIGNATURE].assign(bonus=batch_bonuses(maids_df)["bonus"].to_numpy())
+    return _factorize_rows(fields)
+
+def signature_compression(clients_df, maids_df):
+    """How much profile deduplication shrinks the client x maid scoring work."""
+    n_client_profiles = len(profile_signatures(clients_df, CLIENT_SIGNATURE)[1])
+    n_maid_profiles = len(maid_score_profiles(maids_df)[1])
+    pairs = len(clients_df) * len(maids_df)
+    profile_pairs = n_client_profiles * n_maid_profiles
+    return {
+        "clients": len(clients_df),
+        "client_profiles": n_client_profiles,
+        "maids": len(maids_df),
+        "maid_profiles": n_maid_profiles,
+        "pairs": pairs,
+        "profile_pairs": profile_pairs,
+        "ratio": pairs / profile_pairs if profile_pairs else 1.0
+    }
+
+# -------------------------------
+# REASON CODES
+# -------------------------------
+# Results keep a small integer per theme instead of the explanation text. A
+# code stands for one distinct combination of the fields that theme reads
+# (its key), and the text is produced by the scalar helpers only for rows that
+# are shown or exported, so it reads exactly as calculate_score words it.
+
+REASON_THEMES = {
+    "Household & Kids Reason": "household_kids",
+    "Special Cases Reason": "special_cases",
+    "Pets Reason": "pets",
+    "Living Reason": "living",
+    "Nationality Reason": "nationality",
+    "Cuisine Reason": "cuisine",
+    "Bonus Reasons": "bonus"
+}
+REASON_FIELDS = {**THEME_COLUMNS, "bonus": list(BONUS_DEFAULTS)}
+# Helper names, looked up at call time so perf.instrument wrappers are used
+REASON_SCORERS = {
+    "household_kids": "score_household_kids",
+    "special_cases": "score_special_cases",
+    "pets": "score_pets",
+    "living": "score_living",
+    "nationality": "score_nationality"
+}
+
+@perf.timed("explain.encode")
+def encode_reasons(df):
+    """Reason codes for every row of a pair frame.
+
+    Returns (codes, keys): codes has one small unsigned int column per theme
+    (the REASON_THEMES values) and keys[theme] holds the field values behind
+    each code, one row per code.
+    """
+    codes, keys = {}, {}
+    for theme, fields in REASON_FIELDS.items():
+        present = [c for c in fields if c in df]
+        if present:
+            theme_codes, keys[theme] = _factorize_rows(df[present])
+        else:
+            theme_codes, keys[theme] = np.zeros(len(df), dtype=np.intp), pd.DataFrame(index=range(1))
+        codes[theme] = theme_codes.astype(np.min_scalar_type(len(keys[theme])))
+    return pd.DataFrame(codes), keys
+
+def _reason_text(theme, key):
+    if theme == "bonus":
+        _, bonus_reasons = score_bonuses(key)
+        return ", ".join(bonus_reasons) if bonus_reasons else "None"
+    if theme == "cuisine":
+        return score_cuisine(key["clientmts_cuisine_preference"], key)[1]
+    return globals()[REASON_SCORERS[theme]](*key.values())[1]
+
+def render_reasons(codes, keys, rows=None):
+    """Explanation text for the given row positions of codes (all rows by default).
+
+    Columns are the REASON_THEMES keys, as in calculate_score output. Each
+    distinct code among those rows is rendered once.
+    """
+    if rows is not None:
+        codes = codes.iloc[rows]
+    text = {}
+    with perf.timer("explain.render"):
+        for column, theme in REASON_THEMES.items():
+            used, inverse = np.unique(codes[theme].to_numpy(), return_inverse=True)
+            key = keys[theme]
+            rendered = [_reason_text(theme, {c: key[c].iat[u] for c in key.columns}) for u in used]
+            text[column] = np.asarray(rendered, dtype=object)[inverse]
+    perf.count("explain.rows", len(codes))
+    return pd.DataFrame(text, index=codes.index)
+
+def score_pairs(df):
+    """Compact results for every row of a pair frame.
+
+    Returns (scores, keys): scores has "Final Score %" and the reason codes,
+    one row per row of df; render_reasons(scores, keys, rows) gives the text.
+    """
+    codes, keys = encode_reasons(df)
+    final = score_frame(df)["Final Score %"].reset_index(drop=True)
+    return pd.concat([final, codes], axis=1), keys
+
+# -------------------------------
+# SCORE MATRIX
+# -------------------------------
+# Each theme only looks at a couple of client and maid fields, so the theme
+# score of any client x maid pair can be read from a small table indexed by
+# the client's and maid's category codes for that theme. Broadcasting those
+# tables gives the full client x maid score matrix without scoring pairs.
+
+MATRIX_BLOCK_CELLS = 4_000_000  # client x maid cells scored per block
+
+def theme_multiplier_tables(clients_df, maids_df):
+    """Per-theme (client codes, maid codes, multiplier table).
+
+    The table holds the theme multiplier (NaN when neutral) for every
+    combination of the client's and maid's distinct values of that theme's
+    fields; codes index into it.
+    """
+    tables = {}
+    for theme in THEME_MULTIPLIERS:
+        cols = THEME_COLUMNS[theme]
+        client_codes, client_values = _factorize_rows(clients_df[[c for c in cols if c.startswith("client")]])
+        maid_codes, maid_values = _factorize_rows(maids_df[[c for c in cols if not c.startswith("client")]])
+        tables[theme] = (client_codes, maid_codes, _multiplier_grid(theme, client_values, maid_values))
+    return tables
+
+def _multiplier_grid(theme, client_values, maid_values):
+    # Theme multipliers for every (distinct client values, distinct maid values) combination
+    if len(client_values) == 0 or len(maid_values) == 0:
+        return np.full((len(client_values), len(maid_values)), np.nan)
+    grid = pd.concat([
+        client_values.loc[client_values.index.repeat(len(maid_values))].reset_index(drop=True),
+        pd.concat([maid_values] * len(client_values), ignore_index=True)
+    ], axis=1)
+    values = THEME_MULTIPLIERS[theme](*(grid[c] for c in THEME_COLUMNS[theme]))
+    return values.reshape(len(client_values), len(maid_values))
+
+def pack_theme_tables(multiplier_tables, weights=None):
+    """Per-theme (client codes, maid codes, packed table) for the given weights.
+
+    The packed table holds score * (sum of weights + 1) + weight, where score
+    is the theme score (0 when neutral) and weight the theme weight (0 when
+    neutral). Summed over themes it packs (total score, active weight) into
+    one small int.
+    """
+    weights = dict(_weights_key(weights)[0])
+    stride = sum(weights.values()) + 1
+    max_packed = sum(max(w, int(w * 1.2)) for w in weights.values()) * stride + stride
+    dtype = np.int16 if max_packed <= np.iinfo(np.int16).max else np.int32
+    tables = {}
+    for theme, (client_codes, maid_codes, values) in multiplier_tables.items():
+        active = ~np.isnan(values)
+        packed = np.where(active, weighted(values, weights[theme]), 0) * stride + active * weights[theme]
+        tables[theme] = (client_codes, maid_codes, packed.astype(dtype))
+    return tables
+
+def build_theme_tables(clients_df, maids_df):
+    """Packed per-theme tables for the configured weights (see pack_theme_tables)."""
+    return pack_theme_tables(theme_multiplier_tables(clients_df, maids_df))
+
+@functools.lru_cache(maxsize=2)
+def _final_score_ranks(weights, bonus_cap):
+    # Scores are whole tenths in [0, 100], so ranking the tenths that occur
+    # orders the cells without sorting the table.
+    table = _final_score_table(weights, bonus_cap).reshape(-1)
+    tenths = np.rint(table * 10).astype(np.int32)
+    present = np.bincount(tenths, minlength=1001) > 0
+    ranks = (np.cumsum(present, dtype=np.int32) - 1)[tenths]
+    values = np.empty(int(present.sum()))
+    values[ranks] = table
+    return values, ranks
+
+def final_score_ranks(weights=None, bonus_cap=None):
+    """Distinct final scores in increasing order, and the rank of every final_score_table() cell."""
+    return _final_score_ranks(*_weights_key(weights, bonus_cap))
+
+def rank_matrix(tables, bonus, clients=slice(None), weights=None, bonus_cap=None):
+    """Rank of the final score for the selected clients against every maid.
+
+    Ranks are small ints that order scores exactly; final_score_ranks()[0]
+    maps them back to Final Score %. tables must be packed for the same
+    weights, and bonus already capped at bonus_cap.
+    """
+    packed = 0
+    for client_codes, maid_codes, table in tables.values():
+        packed = packed + np.take(table[client_codes[clients]], maid_codes, axis=1)
+    # packed = total * stride + active weight, so this is the flat cell of
+    # final_score_table()[total, active weight, bonus]
+    cap = _weights_key(weights, bonus_cap)[1]
+    cell = packed.astype(np.int32) * (cap + 1) + bonus[None, :].astype(np.int32)
+    return np.take(final_score_ranks(weights, bonus_cap)[1], cell)
+
+def _top_k(ranks, k, start=None):
+    # Highest rank first; equal scores keep maid order, like a stable sort,
+    # or maid order from column start[row] on, wrapping around.
+    n = ranks.shape[1]
+    k = min(k, n)
+    dtype = np.int32 if (int(ranks.max(initial=0)) + 1) * n < np.iinfo(np.int32).max else np.int64
+    key = ranks.astype(dtype)
+    key *= n
+    key += n - 1 - np.arange(n, dtype=dtype)
+    if start is not None:
+        start = start[:, None].astype(dtype)
+        key += start
+        np.subtract(key, n, out=key, where=np.arange(n) < start)
+    if k < n:
+        candidates = np.argpartition(key, n - k, axis=1)[:, n - k:]
+    else:
+        candidates = np.broadcast_to(np.arange(n), key.shape)
+    order = np.argsort(-np.take_along_axis(key, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+def _profile_top_k(tables, bonus, maid_codes, k, weights=None, bonus_cap=None):
+    # Top k maids for every client profile, scoring blocks of profiles at a time
+    n_profiles, n_maids = len(next(iter(tables.values()))[0]), len(maid_codes)
+    k = min(k, n_maids)
+    maid_idx = np.zeros((n_profiles, k), dtype=np.int64)
+    scores = np.zeros((n_profiles, k))
+    if k == 0:
+        return maid_idx, scores
+    values = final_score_ranks(weights, bonus_cap)[0]
+    block = max(1, MATRIX_BLOCK_CELLS // n_maids)
+    for start in range(0, n_profiles, block):
+        rows = slice(start, min(start + block, n_profiles))
+        with perf.timer("topk.score"):
+            profile_ranks = rank_matrix(tables, bonus, rows, weights, bonus_cap)
+        with perf.timer("topk.select"):
+            top = _top_k(np.take(profile_ranks, maid_codes, axis=1), k)
+            maid_idx[rows] = top
+            scores[rows] = values[np.take_along_axis(profile_ranks, maid_codes[top], axis=1)]
+    perf.count("topk.cells", n_profiles * n_maids)
+    return maid_idx, scores
+
+def top_k_matches(clients_df, maids_df, k=2):
+    """Indices and scores of the k best maids for every client.
+
+    Returns (maid_idx, scores), both shaped (len(clients_df), min(k, len(maids_df))),
+    best first, with ties in maid order.
+    """
+    # Score distinct client profiles against distinct maid profiles, then
+    # expand maid profiles back to maids for selection and client profiles
+    # back to clients for the result.
+    with perf.timer("topk.profiles"):
+        client_codes, client_profiles = profile_signatures(clients_df, CLIENT_SIGNATURE)
+        maid_codes, maid_profiles = maid_score_profiles(maids_df)
+    with perf.timer("topk.tables"):
+        tables = build_theme_tables(client_profiles, maid_profiles)
+    maid_idx, scores = _profile_top_k(tables, maid_profiles["bonus"].to_numpy(), maid_codes, k)
+    return maid_idx[client_codes], scores[client_codes]
+
+# -------------------------------
+# SCORE TENSOR
+# -------------------------------
+# Weight-free scoring state: per theme the multiplier (NaN = neutral), plus
+# the uncapped bonus. Final scores for any THEME_WEIGHTS / BONUS_CAP follow
+# from it in one vectorized pass, without reading the entity fields again.
+# Pair files keep one row per pair; client x maid pools keep the multipliers
+# factorized by profile (a pair's multiplier is table[client code, maid code]).
+
+def raw_bonus(df):
+    """Bonus points before BONUS_CAP."""
+    bonuses = batch_bonuses(df)
+    return bonuses.drop(columns="bonus").sum(axis=1).to_numpy()
+
+def pair_tensor(df):
+    """Multipliers (rows x themes), neutral mask and raw bonus for every row of a pair file."""
+    multipliers = np.column_stack([
+        multipliers(*(df[c] for c in THEME_COLUMNS[theme])) for theme, multipliers in THEME_MULTIPLIERS.items()
+    ])
+    return {"multipliers": multipliers, "neutral": np.isnan(multipliers), "bonus": raw_bonus(df)}
+
+@perf.timed("tensor.pair_scores")
+def pair_tensor_scores(tensor, weights=None, bonus_cap=None):
+    """Final Score % of every pair in a pair_tensor for the given weights and cap."""
+    weights, cap = _weights_key(weights, bonus_cap)
+    w = np.array([weight for _, weight in weights])
+    active = ~tensor["neutral"]
+    total = np.where(active, weighted(tensor["multipliers"], w), 0).sum(axis=1).astype(int)
+    max_total = (active * w).sum(axis=1)
+    return _final_score_table(weights, cap)[total, max_total, np.minimum(tensor["bonus"], cap)]
+
+def pool_tensor(clients_df, maids_df):
+    """Factorized multipliers and raw bonus for every client x maid pair of a pool."""
+    client_codes, client_profiles = profile_signatures(clients_df, CLIENT_SIGNATURE)
+    fields = maids_df[MAID_THEME_SIGNATURE].assign(bonus=raw_bonus(maids_df))
+    maid_codes, maid_profiles = _factorize_rows(fields)
+    return {
+        "client_codes": client_codes,
+        "maid_codes": maid_codes,
+        "tables": theme_multiplier_tables(client_profiles, maid_profiles),
+        "bonus": maid_profiles["bonus"].to_numpy()
+    }
+
+@perf.timed("tensor.top_k")
+def pool_tensor_top_k(tensor, k=2, weights=None, bonus_cap=None):
+    """top_k_matches for the given weights and cap, from a pool_tensor."""
+    tables = pack_theme_tables(tensor["tables"], weights)
+    bonus = np.minimum(tensor["bonus"], _weights_key(weights, bonus_cap)[1])
+    maid_idx, scores = _profile_top_k(tables, bonus, tensor["maid_codes"], k, weights, bonus_cap)
+    return maid_idx[tensor["client_codes"]], scores[tensor["client_codes"]]
+
+# -------------------------------
+# MAID INDEX
+# -------------------------------
+# For interactive single-client queries. Maids are grouped by their theme
+# fields; for each theme the index keeps postings from every distinct value of
+# that theme's maid fields to the groups carrying it, so a query scores each
+# value once (memoized per client values, as in the maid pool). Themes are
+# joined into blocks of at most INDEX_BLOCK_VALUES value combinations, so a
+# query gathers one packed row per block rather than per theme. Within a group
+# all maids share the theme scores and differ only in bonus, so a group's best
+# possible score is known before looking at its maids, and groups that cannot
+# beat the current top-k are never opened.
+
+INDEX_BLOCK_VALUES = 4096  # joint theme values per posting block
+
+@perf.timed("tab3.build_index")
+def build_maid_index(maids_df):
+    """Precompute postings, bonus order and per-group score bounds for maids_df."""
+    theme_fields = maids_df[MAID_THEME_SIGNATURE]
+    group, groups = _factorize_rows(theme_fields)
+    bonus = batch_bonuses(maids_df)["bonus"].to_numpy()
+    # maids ordered by group, then best bonus first, then original position
+    order = np.lexsort((np.arange(len(maids_df)), -bonus, group))
+    offsets = np.searchsorted(group[order], np.arange(len(groups) + 1))
+    postings = {}
+    for theme in THEME_SCORERS:
+        fields = [c for c in THEME_COLUMNS[theme] if not c.startswith("client")]
+        postings[theme] = _factorize_rows(groups[fields])
+    blocks, themes = [], []
+    for theme in postings:
+        shape = [max(len(postings[t][1]), 1) for t in themes + [theme]]
+        if themes and np.prod(shape) > INDEX_BLOCK_VALUES:
+            blocks.append(_posting_block(postings, themes))
+            themes = []
+        themes.append(theme)
+    blocks.append(_posting_block(postings, themes))
+    return {
+        "maid_id": maids_df["maid_id"].to_numpy(),
+        "group": group,
+        "order": order,
+        "offsets": offsets,
+        "bonus": bonus,
+        "max_bonus": bonus[order[offsets[:-1]]] if len(groups) else np.zeros(0, dtype=int),
+        "values": {theme: values for theme, (_, values) in postings.items()},
+        "blocks": blocks,
+        "rows": {}
+    }
+
+def _posting_block(postings, themes):
+    # (themes, joint value code of every group) for a block of themes
+    shape = [max(len(postings[t][1]), 1) for t in themes]
+    return themes, np.ravel_multi_index([postings[t][0] for t in themes], shape)
+
+def _group_members(index, groups, limit=None):
+    # Members of the given groups in index order, with their group, at most
+    # limit per group (a group's best bonuses come first)
+    offsets = index["offsets"]
+    sizes = offsets[groups + 1] - offsets[groups]
+    if limit is not None:
+        sizes = np.minimum(sizes, limit)
+    owner, rank = _repeat_ranks(sizes)
+    return index["order"][offsets[groups][owner] + rank], groups[owner]
+
+@perf.timed("tab3.query")
+def query_maid_index(index, client_row, k=3):
+    """Top-k maids for one client preference dict, identical to a full scan.
+
+    Returns (maid_idx, scores) best first, with ties in maid order.
+    """
+    n_groups = len(index["max_bonus"])
+    if k <= 0 or n_groups == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    # (total score, active weight) per group packed as in pack_theme_tables,
+    # so a score is one lookup in the flattened final_score_table()
+    packed = np.zeros(n_groups, dtype=np.int32)
+    for themes, block_codes in index["blocks"]:
+        row = np.zeros(1, dtype=np.int32)
+        for theme in themes:
+            key = tuple(client_row[c] for c in THEME_COLUMNS[theme] if c.startswith("client"))
+            row = np.add.outer(row, _packed_row(index["rows"], theme, index["values"][theme], key))
+        packed += row.ravel()[block_codes]
+
+    table = final_score_table()
+    cells = table.shape[2]
+    table = table.ravel()
+    bound = table[packed * cells + index["max_bonus"]]
+
+    def member_scores(members, member_group):
+        return table[packed[member_group] * cells + index["bonus"][members]]
+
+    # The k best-bounded groups hold at least k maids; the k-th best score
+    # among their leading maids is a floor every final top-k maid must reach.
+    seed = np.argpartition(-bound, k - 1)[:k] if k < n_groups else np.arange(n_groups)
+    members, member_group = _group_members(index, seed, limit=k)
+    seed_scores = np.sort(member_scores(members, member_group))[::-1]
+    floor = seed_scores[k - 1] if len(seed_scores) >= k else -np.inf
+
+    # Visit the groups that can reach the floor best bound first, in batches
+    # of doubling size, raising the floor as the top-k fills. A group whose
+    # bound equals the floor is still opened, since an earlier maid wins a tie.
+    candidates = np.flatnonzero(bound >= floor)
+    candidates = candidates[np.argsort(-bound[candidates], kind="stable")]
+    best, best_scores = np.zeros(0, dtype=np.int64), np.zeros(0)
+    start, step = 0, k
+    while start < len(candidates) and bound[candidates[start]] >= floor:
+        batch = candidates[start:start + step]
+        members, member_group = _group_members(index, batch[bound[batch] >= floor])
+        scores = member_scores(members, member_group)
+        reach = scores >= floor
+        best = np.concatenate([best, members[reach]])
+        best_scores = np.concatenate([best_scores, scores[reach]])
+        keep = np.lexsort((best, -best_scores))[:k]
+        best, best_scores = best[keep], best_scores[keep]
+        if len(best) == k:
+            floor = max(floor, best_scores[-1])
+        start, step = start + step, step * 2
+    return best, best_scores
+
+# -------------------------------
+# MAID POOL
+# -------------------------------
+# For many queries at once (the matching service), the maid side of the
+# score matrix is prepared once. A query batch only needs each theme's
+# packed row for the client values it contains, and those rows are memoized
+# across batches, so a batch is one blocked top-k pass over maid profiles.
+
+POOL_ROW_CACHE = 4096  # memoized (theme, client values) rows per pool
+
+def build_maid_pool(maids_df):
+    """Maid profiles and per-theme maid values, prepared for query_maid_pool."""
+    maid_codes, maid_profiles = maid_score_profiles(maids_df)
+    themes = {}
+    for theme in THEME_SCORERS:
+        fields = [c for c in THEME_COLUMNS[theme] if not c.startswith("client")]
+        themes[theme] = _factorize_rows(maid_profiles[fields])
+    return {
+        "maid_id": maids_df["maid_id"].to_numpy(),
+        "maid_codes": maid_codes,
+        "bonus": maid_profiles["bonus"].to_numpy(),
+        "themes": themes,
+        "rows": {}
+    }
+
+def validate_client_row(row):
+    """Raise ValueError unless row is a usable client preference dict."""
+    if not isinstance(row, dict):
+        raise ValueError("expected an object of client preferences")
+    missing = [c for c in CLIENT_SIGNATURE if c not in row]
+    if missing:
+        raise ValueError(f"missing fields: {', '.join(missing)}")
+    for c in CLIENT_SIGNATURE:
+        if not isinstance(row[c], str):
+            raise ValueError(f"{c}: expected a string")
+        if c in MASK_FIELDS:
+            token_mask(c, row[c])
+
+def _packed_row(rows, theme, values, key):
+    # Packed scores of one client value tuple against every maid value of the
+    # theme, memoized in rows
+    row = rows.get((theme, key))
+    if row is None:
+        if len(rows) >= POOL_ROW_CACHE:
+            rows.clear()
+        client = dict(zip([c for c in THEME_COLUMNS[theme] if c.startswith("client")], key))
+        multipliers = THEME_MULTIPLIERS[theme](*(
+            np.full(len(values), client[c], dtype=object) if c in client else values[c]
+            for c in THEME_COLUMNS[theme]
+        ))
+        row = rows[(theme, key)] = pack_theme_tables({theme: (None, None, multipliers[None, :])})[theme][2][0]
+    return row
+
+def _pool_row(pool, theme, key):
+    return _packed_row(pool["rows"], theme, pool["themes"][theme][1], key)
+
+@perf.timed("pool.query")
+def query_maid_pool(pool, client_rows, k=3):
+    """Top-k maids for each client preference dict, scored together.
+
+    Returns (maid_idx, scores) shaped (len(client_rows), k), best first with
+    ties in maid order, the same as query_maid_index row by row. Rows must
+    pass validate_client_row.
+    """
+    tables = {}
+    for theme, (maid_theme_codes, _) in pool["themes"].items():
+        fields = [c for c in THEME_COLUMNS[theme] if c.startswith("client")]
+        keys = [tuple(row[c] for c in fields) for row in client_rows]
+        position = {key: i for i, key in enumerate(dict.fromkeys(keys))}
+        table = np.stack([_pool_row(pool, theme, key) for key in position])
+        tables[theme] = (np.array([position[key] for key in keys]), maid_theme_codes, table)
+    perf.count("pool.clients", len(client_rows))
+    return _profile_top_k(tables, pool["bonus"], pool["maid_codes"], k)
+
+# -------------------------------
+# ENTITY STORE
+# -------------------------------
+# Result tables are built for (client, maid) index pairs picked from the
+# unique client and maid tables. Instead of copying both rows into a pair
+# frame and rescoring it, every client and maid is held once as small-int
+# codes per reason theme (its own side of the theme's fields), next to the
+# distinct values behind the codes. Scores and reason codes for index pairs
+# are then table lookups.
+
+def _side_codes(df, fields):
+    # Codes and distinct values of df's share of fields; one shared code if it has none
+    present = [c for c in fields if c in df]
+    if not present:
+        return np.zeros(len(df), dtype=np.intp), pd.DataFrame(index=range(1))
+    codes, values = _factorize_rows(df[present])
+    return codes.astype(np.min_scalar_type(len(values))), values
+
+@perf.timed("entities.build")
+def build_entity_store(clients_df, maids_df):
+    """Clients and maids as per-theme codes, for score_index_pairs.
+
+    Built once per upload. themes[theme] holds (client codes, client values,
+    maid codes, maid values) for each REASON_THEMES theme; tables are the
+    packed theme tables over those codes and bonus the capped maid bonus.
+    """
+    themes = {}
+    for theme, fields in REASON_FIELDS.items():
+        client_codes, client_values = _side_codes(clients_df, [c for c in fields if c.startswith("client")])
+        maid_codes, maid_values = _side_codes(maids_df, [c for c in fields if not c.startswith("client")])
+        themes[theme] = (client_codes, client_values, maid_codes, maid_values)
+    tables = pack_theme_tables({
+        theme: (themes[theme][0], themes[theme][2], _multiplier_grid(theme, themes[theme][1], themes[theme][3]))
+        for theme in THEME_MULTIPLIERS
+    })
+    return {
+        "client_name": clients_df["client_name"].reset_index(drop=True),
+        "maid_id": maids_df["maid_id"].reset_index(drop=True),
+        "themes": themes,
+        "tables": tables,
+        "bonus": batch_bonuses(maids_df)["bonus"].to_numpy().astype(np.uint8)
+    }
+
+@perf.timed("entities.score")
+def score_index_pairs(entities, client_idx, maid_idx):
+    """Compact results for (client, maid) index pairs of an entity store.
+
+    Same columns, scores, reason codes and keys as score_pairs on the
+    joined rows, without joining them.
+    """
+    packed = 0
+    for client_codes, maid_codes, table in entities["tables"].values():
+        packed = packed + table[client_codes[client_idx], maid_codes[maid_idx]].astype(np.int32)
+    cell = packed * (BONUS_CAP + 1) + entities["bonus"][maid_idx]
+    codes, keys = {}, {}
+    for theme, (client_codes, client_values, maid_codes, maid_values) in entities["themes"].items():
+        n_maid_values = len(maid_values)
+        pair_codes, pairs = pd.factorize(client_codes[client_idx].astype(np.int64) * n_maid_values + maid_codes[maid_idx])
+        key = pd.concat([
+            client_values.iloc[pairs // n_maid_values].reset_index(drop=True),
+            maid_values.iloc[pairs % n_maid_values].reset_index(drop=True)
+        ], axis=1)
+        keys[theme] = key[[c for c in REASON_FIELDS[theme] if c in key]]
+        codes[theme] = pair_codes.astype(np.min_scalar_type(len(pairs)))
+    perf.count("entities.pairs", len(client_idx))
+    return pd.concat([
+        entities["client_name"].take(client_idx).reset_index(drop=True),
+        entities["maid_id"].take(maid_idx).reset_index(drop=True),
+        pd.DataFrame({"Final Score %": final_score_table().reshape(-1)[cell], **codes})
+    ], axis=1), keys
+
+# -------------------------------
+# CAPACITY-AWARE ASSIGNMENT
+# -------------------------------
+# Top-k per client ignores that a popular maid can only take so many clients.
+# The assignment keeps each client's best `candidates` maids as a sparse graph
+# and maximizes total score under per-client quotas and per-maid capacities.
+# It is solved exactly on that graph as a sparse rectangular assignment
+# (scipy's min_weight_full_bipartite_matching, a shortest augmenting path
+# solver): client slots are rows, maid slots are columns, and each client slot
+# also gets a private "unassigned" column so a full matching always exists.
+#
+# Many maids tie at the top score for a client, and breaking those ties by
+# maid position would give every such client the same few maids. Clients
+# sharing a scoring profile therefore deal the profile's best maids out
+# round-robin. Clients left short of their quota are then solved again
+# against the maids with capacity left only, with candidate lists twice as
+# deep each round, until none with a positive score remain. Those rounds keep
+# the earlier assignments, so they only score and solve the residual clients
+# and maids rather than the whole growing graph.
+
+def _as_counts(value, n):
+    return np.broadcast_to(np.asarray(value, dtype=np.int64), (n,)).copy()
+
+def _repeat_ranks(counts):
+    """np.repeat(np.arange(len(counts)), counts) and the position of each entry within its run."""
+    owner = np.repeat(np.arange(len(counts)), counts)
+    return owner, np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+def _unassigned(assigned_clients, quota):
+    # Clients with a quota that got no maid
+    return int(((quota > 0) & (np.bincount(assigned_clients, minlength=len(quota)) == 0)).sum())
+
+def _greedy_assignment(edge_client, edge_maid, edge_benefit, quota, capacity):
+    # Best edges first; ties keep edge order (by client, then candidate order)
+    used = np.zeros(len(edge_client), dtype=bool)
+    quota_left, capacity_left = quota.copy(), capacity.copy()
+    for e in np.argsort(-edge_benefit, kind="stable"):
+        i, m = edge_client[e], edge_maid[e]
+        if quota_left[i] and capacity_left[m]:
+            used[e] = True
+            quota_left[i] -= 1
+            capacity_left[m] -= 1
+    return used
+
+def _dealt_candidates(tables, bonus, client_codes, maid_codes, clients, maids, depth):
+    """Candidate edges (client, maid, benefit) from the given clients to the given maids.
+
+    Clients sharing a profile split the profile's best depth * (number of
+    them) maids round-robin, so each gets up to depth maids. Equal scores are
+    ranked in maid order starting right after the maids dealt to the profiles
+    before, so tied maids are spread over profiles too. Benefit is Final
+    Score % in integer tenths; edges without a positive score are dropped.
+    """
+    edges = ([], [], [])
+    n = len(maids)
+    if not len(clients) or not n:
+        return tuple(np.zeros(0, dtype=np.int64) for _ in edges)
+    values = final_score_ranks()[0]
+    # score each of the given maids directly, one column per maid
+    tables = {theme: (c, m[maid_codes[maids]], t) for theme, (c, m, t) in tables.items()}
+    bonus = bonus[maid_codes[maids]]
+    order = np.argsort(client_codes[clients], kind="stable")
+    profiles, starts, counts = np.unique(client_codes[clients][order], return_index=True, return_counts=True)
+    want = np.minimum(depth * counts, n)
+    offsets = (np.cumsum(want) - want) % n
+    block = max(1, MATRIX_BLOCK_CELLS // n)
+    for b in range(0, len(profiles), block):
+        rows = slice(b, min(b + block, len(profiles)))
+        with perf.timer("assign.candidates"):
+            ranks = rank_matrix(tables, bonus, profiles[rows])
+            top = _top_k(ranks, want[rows].max(), offsets[rows])
+            i, j = np.nonzero(np.arange(top.shape[1]) < want[rows, None])
+            edges[0].append(clients[order[starts[rows][i] + j % counts[rows][i]]])
+            edges[1].append(maids[top[i, j]])
+            edges[2].append(np.rint(values[ranks[i, top[i, j]]] * 10).astype(np.int64))
+    edge_client, edge_maid, edge_benefit = (np.concatenate(e).astype(np.int64) for e in edges)
+    keep = edge_benefit > 0
+    return edge_client[keep], edge_maid[keep], edge_benefit[keep]
+
+def _optimal_assignment(edge_client, edge_maid, edge_benefit, quota, capacity):
+    """Mask of candidate edges used by a maximum-benefit assignment."""
+    n_edges = len(edge_client)
+    client_slot = np.concatenate([[0], np.cumsum(quota)])
+    maid_slot = np.concatenate([[0], np.cumsum(capacity)])
+    n_client_slots, n_maid_slots = client_slot[-1], maid_slot[-1]
+    unused = np.full(n_client_slots, -1)
+
+    if quota.max(initial=0) <= 1 or capacity.max(initial=0) <= 1:
+        # One side has single slots, so a client can never hold two slots of
+        # the same maid: link every client slot to every slot of its maids.
+        links = quota[edge_client] * capacity[edge_maid]
+        arc_edge, k = _repeat_ranks(links)
+        per_client = capacity[edge_maid][arc_edge]
+        rows = [client_slot[edge_client][arc_edge] + k // per_client, np.arange(n_client_slots)]
+        cols = [maid_slot[edge_maid][arc_edge] + k % per_client, n_maid_slots + np.arange(n_client_slots)]
+        weights = [edge_benefit[arc_edge], np.zeros(n_client_slots, dtype=np.int64)]
+        arcs = [arc_edge, unused]
+        shape = (n_client_slots, n_maid_slots + n_client_slots)
+    else:
+        # Route each candidate edge through its own row and column so it is
+        # used at most once: client slot -> edge column carries the score,
+        # and the edge row then takes a slot of the maid (edge used) or its
+        # own edge column (edge unused).
+        edge_col = n_maid_slots + np.arange(n_edges)
+        edge_row = n_client_slots + np.arange(n_edges)
+        take, r = _repeat_ranks(quota[edge_client])
+        fill, c = _repeat_ranks(capacity[edge_maid])
+        rows = [client_slot[edge_client][take] + r, edge_row[fill], edge_row, np.arange(n_client_slots)]
+        cols = [edge_col[take], maid_slot[edge_maid][fill] + c, edge_col,
+                n_maid_slots + n_edges + np.arange(n_client_slots)]
+        weights = [edge_benefit[take], np.zeros(len(fill) + n_edges + n_client_slots, dtype=np.int64)]
+        arcs = [take, np.full(len(fill) + n_edges, -1), unused]
+        shape = (n_client_slots + n_edges, n_maid_slots + n_edges + n_client_slots)
+
+    rows, cols, arcs = np.concatenate(rows), np.concatenate(cols), np.concatenate(arcs)
+    # Every row is matched exactly once, so adding 1 to every weight keeps the
+    # optimum and keeps zero-benefit links from being dropped as empty entries.
+    weights = np.concatenate(weights).astype(float) + 1
+    graph = csr_matrix((weights, (rows, cols)), shape=shape)
+    matched_rows, matched_cols = min_weight_full_bipartite_matching(graph, maximize=True)
+
+    # find the arc behind each matched (row, column)
+    key = rows * shape[1] + cols
+    order = np.argsort(key)
+    found = order[np.searchsorted(key[order], matched_rows * shape[1] + matched_cols)]
+    used = np.zeros(n_edges, dtype=bool)
+    used[arcs[found][arcs[found] >= 0]] = True
+    return used
+
+def solve_assignment(clients_df, maids_df, capacity=1, quota=1, candidates=20):
+    """Assign maids to clients maximizing total Final Score %.
+
+    capacity (per maid) and quota (per client) are ints or arrays. Each
+    client starts with up to `candidates` maids (see _dealt_candidates) and
+    the assignment is optimal over those. Clients left below quota are then
+    assigned optimally among the maids with capacity left, round after
+    round, keeping earlier assignments, until no such maid scores above 0
+    for them. Returns
+    (pairs, stats): pairs has client_idx, maid_idx and "Final Score %" per
+    assigned pair, by client and best first; stats counts assigned pairs and
+    clients left without a maid, and compares the total with the greedy
+    baseline (best remaining pair first) on the same graph.
+    """
+    quota = _as_counts(quota, len(clients_df))
+    capacity = _as_counts(capacity, len(maids_df))
+    depth = max(int(candidates), int(quota.max(initial=1)))
+    with perf.timer("assign.tables"):
+        client_codes, client_profiles = profile_signatures(clients_df, CLIENT_SIGNATURE)
+        maid_codes, maid_profiles = maid_score_profiles(maids_df)
+        tables = build_theme_tables(client_profiles, maid_profiles)
+    bonus = maid_profiles["bonus"].to_numpy()
+
+    # Final Score % has one decimal, so benefits are integer tenths. Each
+    # round solves the clients still short against the maids still open,
+    # keeping earlier assignments.
+    quota_left, capacity_left = quota.copy(), capacity.copy()
+    edges, used = [], []
+    while True:
+        open_maids = np.flatnonzero(capacity_left > 0)
+        new = _dealt_candidates(
+            tables, bonus, client_codes, maid_codes, np.flatnonzero(quota_left > 0), open_maids, depth
+        )
+        if not len(new[0]):
+            break
+        # A client short of a quota above 1 may already hold an open maid
+        # (any other earlier edge between them would have been used); when
+        # only such edges come back, deal deeper.
+        if edges:
+            held = np.concatenate([e[0][u] * len(capacity) + e[1][u] for e, u in zip(edges, used)])
+            fresh = ~np.isin(new[0] * len(capacity) + new[1], held)
+            new = tuple(e[fresh] for e in new)
+            if not len(new[0]):
+                if depth >= len(open_maids):
+                    break
+                depth *= 2
+                continue
+        with perf.timer("assign.optimal"):
+            new_used = _optimal_assignment(*new, quota_left, capacity_left)
+        quota_left -= np.bincount(new[0][new_used], minlength=len(quota))
+        capacity_left -= np.bincount(new[1][new_used], minlength=len(capacity))
+        edges.append(new)
+        used.append(new_used)
+        depth *= 2
+    rounds = len(edges)
+    perf.count("assign.rounds", rounds)
+    edge_client, edge_maid, edge_benefit = (
+        np.concatenate([e[i] for e in edges] or [np.zeros(0, dtype=np.int64)]) for i in range(3)
+    )
+    used = np.concatenate(used or [np.zeros(0, dtype=bool)])
+
+    # Edges by client, best first, for the greedy tie order and the result
+    order = np.lexsort((-edge_benefit, edge_client))
+    edge_client, edge_maid, edge_benefit, used = edge_client[order], edge_maid[order], edge_benefit[order], used[order]
+    with perf.timer("assign.greedy"):
+        greedy = _greedy_assignment(edge_client, edge_maid, edge_benefit, quota, capacity)
+
+    pairs = pd.DataFrame({
+        "client_idx": edge_client[used],
+        "maid_idx": edge_maid[used],
+        "Final Score %": edge_benefit[used] / 10
+    })
+    total = edge_benefit[used].sum() / 10
+    greedy_total = edge_benefit[greedy].sum() / 10
+    return pairs, {
+        "assigned": int(used.sum()),
+        "unassigned_clients": _unassigned(edge_client[used], quota),
+        "candidate_edges": len(edge_client),
+        "rounds": rounds,
+        "total": total,
+        "greedy_assigned": int(greedy.sum()),
+        "greedy_unassigned_clients": _unassigned(edge_client[greedy], quota),
+        "greedy_total": greedy_total,
+        "greedy_gap": total - greedy_total,
+        "greedy_gap_pct": (total - greedy_total) / total * 100 if total else 0.0
+    }
+
+# -------------------------------
+# MATCH TABLES
+# -------------------------------
+# Clients and maids as Tab 2 and the batch job see them: one row per
+# client_name / maid_id, with the columns scoring needs.
+
+CLIENT_COLUMNS = [
+    "client_name", "clientmts_household_type", "clientmts_special_cases",
+    "clientmts_pet_type", "clientmts_dayoff_policy",
+    "clientmts_nationality_preference", "clientmts_living_arrangement",
+    "clientmts_cuisine_preference"
+]
+
+MAID_COLUMNS = [
+    "maid_id", "years_of_experience", "maidspeaks_amharic", "maidspeaks_arabic",
+    "maidspeaks_english", "maidspeaks_french", "maidspeaks_oromo",
+    "maid_grouped_nationality", "maid_cooking_khaleeji", "maid_cooking_lebanese",
+    "maid_cooking_international", "maid_cooking_not_specified",
+    "maidmts_household_type", "maidmts_pet_type", "maidmts_dayoff_policy",
+    "maidmts_living_arrangement", "maidpref_education", "maidpref_kids_experience",
+    "maidpref_pet_handling", "maidpref_personality", "maidpref_travel",
+    "maidpref_smoking", "maidpref_caregiving_profile"
+]
+
+def unique_clients(df):
+    return df[CLIENT_COLUMNS].drop_duplicates(subset=["client_name"]).reset_index(drop=True)
+
+def unique_maids(df):
+    return df[MAID_COLUMNS].drop_duplicates(subset=["maid_id"]).reset_index(drop=True)
+
+def match_pairs(clients_df, maids_df, client_idx, maid_idx, entities=None):
+    """Compact results for (client, maid) index pairs.
+
+    Returns (results, keys): results has client_name, maid_id, "Final Score %"
+    and the reason codes; explain_matches renders the text. Pass the upload's
+    entity store to skip building one.
+    """
+    client_idx, maid_idx = np.asarray(client_idx, dtype=np.intp), np.asarray(maid_idx, dtype=np.intp)
+    if entities is None:
+        entities = build_entity_store(clients_df, maids_df)
+    return score_index_pairs(entities, client_idx, maid_idx)
+
+def pair_file_results(df):
+    """Compact results for every row of a pair file, in file order (see match_pairs)."""
+    scored, keys = score_pairs(df)
+    return pd.concat([df[["client_name", "maid_id"]].reset_index(drop=True), scored], axis=1), keys
+
+def pair_labels(results):
+    """"client ↔ maid (score%)" for each result row, as an array indexed like results."""
+    return (
+        results["client_name"].astype(str) + " ↔ " + results["maid_id"].astype(str)
+        + " (" + results["Final Score %"].astype(str) + "%)"
+    ).to_numpy(dtype=object)
+
+def explain_matches(results, keys, rows=None):
+    """Rows of a compact result with the reason codes replaced by their text."""
+    if rows is not None:
+        results = results.iloc[rows]
+    shown = results.drop(columns=list(REASON_THEMES.values()))
+    return pd.concat([shown, render_reasons(results, keys)], axis=1)
+
+def top_match_results(clients_df, maids_df, k=2, entities=None):
+    """Each client's top k maids, best first, as compact results (see match_pairs)."""
+    maid_idx, _ = top_k_matches(clients_df, maids_df, k)
+    client_idx = np.repeat(np.arange(len(clients_df)), maid_idx.shape[1])
+    return match_pairs(clients_df, maids_df, client_idx, maid_idx.ravel(), entities)
+
+def optimal_matches(clients_df, maids_df, k=2):
+    """Each client's top k maids, best first, with explanations."""
+    return explain_matches(*top_match_results(clients_df, maids_df, k))
+
+# -------------------------------
+# RESULT VIEWS
+# -------------------------------
+# A view is an array of row positions into a compact result table, filtered
+# and then sorted. The UI shows one page of it at a time and exports it in
+# chunks, so neither the browser nor an export ever gets a whole explained
+# copy of the table.
+
+EXPORT_CHUNK_ROWS = 50_000
+EXPORT_FORMATS = {  # format -> (mime type, file suffix)
+    "csv": ("text/csv", ".csv"),
+    "csv.gz": ("application/gzip", ".csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet")
+}
+
+def _name_matches(column, text):
+    # Case-insensitive substring match, testing each distinct value once
+    codes, uniques = pd.factorize(column)
+    hit = pd.Index(uniques).astype(str).str.contains(text, case=False, regex=False)
+    return np.append(np.asarray(hit, dtype=bool), False)[codes]  # code -1 (missing) never matches
+
+def _view_column(results, extra, name):
+    return pd.Series(extra[name]) if extra and name in extra else results[name].reset_index(drop=True)
+
+@perf.timed("view.rows")
+def result_view(results, min_score=None, client=None, maid=None, sort_by=None, descending=False,
+                extra=None, score="Final Score %"):
+    """Row positions of results passing the filters, in display order.
+
+    min_score applies to the score column; client and maid are substrings of
+    client_name and maid_id. score and sort_by name columns of results or of
+    extra (arrays aligned with results). The sort is stable, so ties keep
+    their order in results; without sort_by rows stay in results order.
+    """
+    keep = np.ones(len(results), dtype=bool)
+    if min_score is not None:
+        keep &= _view_column(results, extra, score).to_numpy() >= min_score
+    if client:
+        keep &= _name_matches(results["client_name"], client)
+    if maid:
+        keep &= _name_matches(results["maid_id"], maid)
+    rows = np.flatnonzero(keep)
+    if sort_by is not None:
+        column = _view_column(results, extra, sort_by).iloc[rows].reset_index(drop=True)
+        order = column.sort_values(ascending=not descending, kind="stable").index
+        rows = rows[order.to_numpy()]
+    return rows
+
+def result_page(results, rows, page, page_size, extra=None):
+    """Page `page` (from 0) of a view without the reason codes, indexed by result row."""
+    rows = rows[page * page_size:(page + 1) * page_size]
+    shown = results.iloc[rows].drop(columns=list(REASON_THEMES.values()), errors="ignore")
+    for name, values in (extra or {}).items():
+        shown[name] = np.asarray(values)[rows]
+    return shown
+
+def export_chunks(results, keys, rows=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Frames of a view (all rows by default), chunk_rows at a time.
+
+    With keys the reason codes are rendered as text (explain_matches);
+    without, rows are taken as they are. An empty view gives one empty frame.
+    """
+    rows = np.arange(len(results)) if rows is None else np.asarray(rows, dtype=np.intp)
+    for start in range(0, max(len(rows), 1), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        yield explain_matches(results, keys, chunk) if keys is not None else results.iloc[chunk]
+
+@perf.timed("export.write")
+def write_results(chunks, out, fmt="csv"):
+    """Write frames to a path or binary file as one CSV, gzip CSV or Parquet file.
+
+    Chunks are written as they come (Parquet: one row group each), so only
+    one is held at a time. Returns the number of rows written.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}; expected one of {', '.join(EXPORT_FORMATS)}")
+    if isinstance(out, (str, Path)):
+        with open(out, "wb") as f:
+            return write_results(chunks, f, fmt)
+    rows = 0
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(out, table.schema)
+                writer.write_table(table.cast(writer.schema))
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows
+    stream = gzip.GzipFile(fileobj=out, mode="wb", mtime=0) if fmt == "csv.gz" else out
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    try:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(text, header=i == 0, index=False)
+            rows += len(chunk)
+    finally:
+        text.flush()
+        text.detach()  # leave out open for the caller
+        if stream is not out:
+            stream.close()
+    return rows
+
+# -------------------------------
+# SCORE STORE
+# -------------------------------
+# Daily uploads mostly repeat yesterday's clients and maids. The store keeps,
+# per scoring configuration, each client's top-k list and a snapshot of the
+# maid pool, identified by content hashes of the scoring fields. On the next
+# run only new or changed clients are scored against every maid; the others
+# keep their list and are only scored against new or changed maids.
+
+SCORE_STORE_PATH = Path(".score_store.sqlite")
+SCORE_STORE_EXTRA = 8  # list entries kept beyond k, so a few removed maids do not force a rescore
+SCORING_VERSION = 1  # bump when a score_* helper or its vectorized counterpart changes
+
+def scoring_config_hash():
+    """Hash of everything besides the entity fields that can change a score."""
+    config = {
+        "version": SCORING_VERSION,
+        "weights": THEME_WEIGHTS,
+        "bonus_cap": BONUS_CAP,
+        "client_fields": CLIENT_SIGNATURE,
+        "maid_fields": MAID_SIGNATURE,
+        "token_rules": _token_rules()
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+def entity_hashes(df, signature):
+    """64-bit content hash of each row's scoring fields (as int64 for SQLite).
+
+    Numeric fields are hashed as float64, so a column read as float because
+    of one missing value hashes the same as when it was read as int.
+    """
+    fields = df[[c for c in signature if c in df]]
+    fields = fields.astype({c: "float64" for c in fields.columns if pd.api.types.is_numeric_dtype(fields[c])})
+    return pd.util.hash_pandas_object(fields, index=False).to_numpy().view(np.int64)
+
+def _open_store(path):
+    con = sqlite3.connect(path)
+    con.execute("CREATE TABLE IF NOT EXISTS maids (config TEXT, maid_id TEXT, hash INTEGER, pos INTEGER)")
+    con.execute("CREATE TABLE IF NOT EXISTS top_k (config TEXT, client TEXT, hash INTEGER, rank INTEGER, "
+                "maid_id TEXT, score REAL)")
+    return con
+
+def _load_store(path, config):
+    con = _open_store(path)
+    try:
+        maids = pd.read_sql_query("SELECT maid_id, hash, pos FROM maids WHERE config = ?", con, params=(config,))
+        lists = pd.read_sql_query("SELECT client, hash, rank, maid_id, score FROM top_k "
+                                  "WHERE config = ? ORDER BY client, rank", con, params=(config,))
+    finally:
+        con.close()
+    return maids, lists
+
+def _save_store(path, config, client_key, client_hash, maid_key, maid_hash, lists, list_scores):
+    rows, rank = np.nonzero(lists >= 0)
+    con = _open_store(path)
+    try:
+        with con:
+            con.execute("DELETE FROM maids WHERE config = ?", (config,))
+            con.execute("DELETE FROM top_k WHERE config = ?", (config,))
+            con.executemany("INSERT INTO maids VALUES (?, ?, ?, ?)", zip(
+                [config] * len(maid_key), maid_key, maid_hash.tolist(), range(len(maid_key))))
+            con.executemany("INSERT INTO top_k VALUES (?, ?, ?, ?, ?, ?)", zip(
+                [config] * len(rows), client_key[rows], client_hash[rows].tolist(), rank.tolist(),
+                maid_key[lists[rows, rank]], list_scores[rows, rank].tolist()))
+    finally:
+        con.close()
+
+def _padded(n_rows, width):
+    # Ranked lists with unused slots marked by maid -1 and score -inf
+    return np.full((n_rows, width), -1, dtype=np.intp), np.full((n_rows, width), -np.inf)
+
+def incremental_top_k(clients_df, maids_df, k=2, store_path=SCORE_STORE_PATH):
+    """top_k_matches, reusing the score store for unchanged clients and maids.
+
+    Returns (maid_idx, scores, stats) exactly as top_k_matches would, and
+    saves the new lists to the store. stats counts reused and rescored
+    clients, changed maids and client x maid pairs reused vs recomputed.
+    """
+    n_clients, n_maids = len(clients_df), len(maids_df)
+    depth = min(k + SCORE_STORE_EXTRA, n_maids)
+    config = scoring_config_hash()
+    client_key = clients_df["client_name"].astype(str).to_numpy()
+    client_hash = entity_hashes(clients_df, CLIENT_SIGNATURE)
+    maid_key = maids_df["maid_id"].astype(str).to_numpy()
+    maid_hash = entity_hashes(maids_df, MAID_SIGNATURE)
+    with perf.timer("store.load"):
+        old_maids, old_lists = _load_store(store_path, config)
+
+    # Maids that kept their id and scoring fields, at their new position
+    current = pd.DataFrame({"maid_id": maid_key, "hash": maid_hash, "new_pos": np.arange(n_maids)})
+    kept = old_maids.merge(current, on=["maid_id", "hash"]).sort_values("pos")
+    changed_maids = np.setdiff1d(np.arange(n_maids), kept["new_pos"].to_numpy())
+    # Lists rank equal scores by maid position, which only carries over if
+    # the kept maids are still in the same relative order.
+    in_order = bool(np.all(np.diff(kept["new_pos"].to_numpy()) > 0))
+
+    # A stored list is the exact top of the old pool, so its kept entries are
+    # the exact top of the kept maids. It is reusable if the client did not
+    # change and at least k entries survive (or it held every old maid).
+    reuse_rows = np.zeros(0, dtype=np.intp)
+    if in_order and len(old_lists):
+        survivors = old_lists.merge(kept[["maid_id", "new_pos"]], on="maid_id")
+        per_client = old_lists.groupby("client", sort=False).agg(hash=("hash", "first"), n=("rank", "size"))
+        per_client["kept"] = survivors.groupby("client").size().reindex(per_client.index, fill_value=0)
+        per_client["complete"] = per_client["n"] == len(old_maids)
+        position = pd.Series(np.arange(n_clients), index=client_key)
+        usable = per_client[(per_client["complete"] | (per_client["kept"] >= k)) & per_client.index.isin(client_key)]
+        usable = usable[usable["hash"].to_numpy() == client_hash[position[usable.index].to_numpy()]]
+        reuse_rows = position[usable.index].to_numpy()
+        complete = usable["complete"].to_numpy()
+
+        survivors = survivors[survivors["client"].isin(usable.index)]
+        row = pd.Series(np.arange(len(usable)), index=usable.index)[survivors["client"]].to_numpy()
+        col = survivors.groupby("client", sort=False).cumcount().to_numpy()
+        reused_idx, reused_score = _padded(len(usable), col.max(initial=-1) + 1)
+        reused_idx[row, col] = survivors["new_pos"].to_numpy(dtype=np.intp)
+        reused_score[row, col] = survivors["score"].to_numpy(dtype=float)
+
+    lists, list_scores = _padded(n_clients, depth)
+    rescore_rows = np.setdiff1d(np.arange(n_clients), reuse_rows)
+    if len(rescore_rows):
+        lists[rescore_rows], list_scores[rescore_rows] = top_k_matches(
+            clients_df.iloc[rescore_rows].reset_index(drop=True), maids_df, depth)
+    if len(reuse_rows):
+        fresh_idx, fresh_score = _padded(len(reuse_rows), 0)
+        if len(changed_maids):
+            fresh_idx, fresh_score = top_k_matches(clients_df.iloc[reuse_rows].reset_index(drop=True),
+                                                   maids_df.iloc[changed_maids].reset_index(drop=True), depth)
+            fresh_idx = changed_maids[fresh_idx]
+        # Merge by score, ties to the earlier maid, padding last
+        idx, score = np.hstack([reused_idx, fresh_idx]), np.hstack([reused_score, fresh_score])
+        order = np.lexsort((np.where(idx < 0, n_maids, idx), -score), axis=-1)
+        idx, score = np.take_along_axis(idx, order, axis=1), np.take_along_axis(score, order, axis=1)
+        # Past the last stored entry an unseen kept maid could rank, so an
+        # incomplete list is only exact up to there.
+        from_stored = (order < reused_idx.shape[1]) & (idx >= 0)
+        through_last_stored = np.where(from_stored.any(axis=1), idx.shape[1] - np.argmax(from_stored[:, ::-1], axis=1), 0)
+        exact = np.where(complete, (idx >= 0).sum(axis=1), through_last_stored)
+        beyond = np.arange(idx.shape[1]) >= np.minimum(exact, depth)[:, None]
+        idx[beyond], score[beyond] = -1, -np.inf
+        width = min(idx.shape[1], depth)
+        lists[reuse_rows, :width], list_scores[reuse_rows, :width] = idx[:, :width], score[:, :width]
+
+    # Nothing to write back if every client and maid was found unchanged in place
+    unchanged = (not len(rescore_rows) and not len(changed_maids) and len(old_maids) == n_maids
+                 and np.array_equal(kept["pos"].to_numpy(), kept["new_pos"].to_numpy()))
+    if not unchanged:
+        with perf.timer("store.save"):
+            _save_store(store_path, config, client_key, client_hash, maid_key, maid_hash, lists, list_scores)
+
+    k_out = min(k, n_maids)
+    recomputed = len(rescore_rows) * n_maids + len(reuse_rows) * len(changed_maids)
+    perf.count("store.pairs_reused", n_clients * n_maids - recomputed)
+    perf.count("store.pairs_recomputed", recomputed)
+    return lists[:, :k_out], list_scores[:, :k_out], {
+        "clients_reused": len(reuse_rows),
+        "clients_rescored": len(rescore_rows),
+        "maids_changed": len(changed_maids),
+        "pairs_reused": n_clients * n_maids - recomputed,
+        "pairs_recomputed": recomputed
+    }
+
+def incremental_match_results(clients_df, maids_df, k=2, store_path=SCORE_STORE_PATH, entities=None):
+    """top_match_results through the score store; returns (results, keys, stats)."""
+    maid_idx, _, stats = incremental_top_k(clients_df, maids_df, k, store_path)
+    client_idx = np.repeat(np.arange(len(clients_df)), maid_idx.shape[1])
+    return *match_pairs(clients_df, maids_df, client_idx, maid_idx.ravel(), entities), stats
+
+# -------------------------------
+# INGESTION
+# -------------------------------
+# Streamlit reruns the whole script on every widget change, so the upload is
+# parsed once per content hash. Parsing reads CSVs in chunks, stores the
+# preference columns as category and the 0/1 flags as int8, and keeps the
+# result as Parquet under INGEST_CACHE_DIR so the same file loads without
+# parsing again, even after a restart. Cache file names carry
+# ingest_schema_tag() next to the content hash, so frames parsed or validated
+# under other rules are never reused, and only the INGEST_CACHE_ENTRIES most
+# recently used uploads are kept.
+
+INGEST_CACHE_DIR = Path(".ingest_cache")
+INGEST_CACHE_ENTRIES = 32
+INGEST_FORMAT_VERSION = 1  # bump when read_dataset or optimize_dtypes change
+CSV_CHUNK_ROWS = 100_000
+CATEGORY_PREFIXES = ("clientmts_", "maidmts_", "maidpref_")
+
+@perf.timed("ingest.hash")
+def upload_digest(data):
+    """Content hash of the uploaded bytes, used as the cache key."""
+    return hashlib.sha256(data).hexdigest()
+
+def ingest_schema_tag():
+    """Hash of the parsing and validation rules a cached frame was built under."""
+    config = {
+        "version": INGEST_FORMAT_VERSION,
+        "pandas": pd.__version__,
+        "category_prefixes": CATEGORY_PREFIXES,
+        "token_rules": _token_rules()
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+def _evict_ingest_cache(cache_dir):
+    # Drop all but the INGEST_CACHE_ENTRIES most recently used uploads (reads
+    # touch their files)
+    entries = sorted(cache_dir.glob("*.parquet"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for cached in entries[INGEST_CACHE_ENTRIES:]:
+        cached.unlink(missing_ok=True)
+        cached.with_suffix(".json").unlink(missing_ok=True)
+
+def _category_columns(frame):
+    return [c for c in frame.columns
+            if c.startswith(CATEGORY_PREFIXES) and not pd.api.types.is_numeric_dtype(frame[c])]
+
+def _flag_columns(frame):
+    # Integer (or NaN-free float) columns holding only 0 and 1
+    flags = []
+    for c in frame.columns:
+        col = frame[c]
+        if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col) and col.notna().all():
+            if col.isin([0, 1]).all():
+                flags.append(c)
+    return flags
+
+def optimize_dtypes(frame):
+    """Preference columns to category, 0/1 flag columns to int8 (in place)."""
+    for c in _category_columns(frame):
+        frame[c] = frame[c].astype("category")
+    for c in _flag_columns(frame):
+        frame[c] = frame[c].astype(np.int8)
+    return frame
+
+def _concat_chunks(chunks):
+    # Chunks only share a categorical dtype if their categories agree, so
+    # widen every chunk to the union before concatenating.
+    if len(chunks) > 1:
+        for c in _category_columns(chunks[0]):
+            if all(isinstance(ch[c].dtype, pd.CategoricalDtype) for ch in chunks):
+                categories = pd.api.types.union_categoricals([ch[c] for ch in chunks]).categories
+                for ch in chunks:
+                    ch[c] = ch[c].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
+
+def read_dataset(data, name, chunksize=CSV_CHUNK_ROWS):
+    """Parse uploaded CSV/Excel bytes into an optimized frame.
+
+    Returns (frame, raw_bytes) where raw_bytes is the deep memory footprint
+    the frame would have had with pandas' default dtypes.
+    """
+    if not name.endswith(".csv"):
+        frame = pd.read_excel(io.BytesIO(data))
+        raw_bytes = int(frame.memory_usage(deep=True).sum())
+        return optimize_dtypes(frame), raw_bytes
+
+    chunks, raw_bytes = [], 0
+    for chunk in pd.read_csv(io.BytesIO(data), chunksize=chunksize):
+        raw_bytes += int(chunk.memory_usage(deep=True).sum())
+        for c in _category_columns(chunk):
+            chunk[c] = chunk[c].astype("category")
+        chunks.append(chunk)
+    if not chunks:
+        return pd.read_csv(io.BytesIO(data)), 0
+    # Flags are downcast on the whole frame: a chunk of all zeros says
+    # nothing about the column as a whole.
+    frame = _concat_chunks(chunks)
+    for c in _flag_columns(frame):
+        frame[c] = frame[c].astype(np.int8)
+    return frame, raw_bytes
+
+def ingest_upload(data, name, cache_dir=INGEST_CACHE_DIR, digest=None):
+    """Load an upload through the on-disk Parquet cache.
+
+    Returns (frame, report); report holds the digest, whether the frame came
+    from the cache, raw and optimized memory and the time taken. Raises
+    ValueError for preference values outside the token vocabularies.
+    """
+    start = time.perf_counter()
+    digest = digest or upload_digest(data)
+    cache_dir = Path(cache_dir)
+    stem = f"{digest}-{ingest_schema_tag()}"
+    cached, meta = cache_dir / f"{stem}.parquet", cache_dir / f"{stem}.json"
+
+    frame = None
+    if cached.exists() and meta.exists():
+        try:
+            with perf.timer("ingest.cache_read"):
+                frame, raw_bytes = pd.read_parquet(cached), json.loads(meta.read_text())["raw_bytes"]
+            source = "cache"
+        except (ImportError, OSError, ValueError, KeyError):
+            frame = None
+    if frame is not None:
+        try:
+            cached.touch()  # most recently used, for eviction
+        except OSError:
+            pass
+    if frame is None:
+        with perf.timer("ingest.parse"):
+            frame, raw_bytes = read_dataset(data, name)
+        with perf.timer("ingest.validate"):
+            encode_masks(frame)  # unknown preference tokens fail here, before caching
+        source = "parsed"
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            with perf.timer("ingest.cache_write"):
+                frame.to_parquet(cached, index=False)
+                meta.write_text(json.dumps({"name": name, "raw_bytes": raw_bytes}))
+            _evict_ingest_cache(cache_dir)
+        except (ImportError, OSError):
+            pass  # no pyarrow or read-only directory: keep the in-memory result
+
+    optimized = int(frame.memory_usage(deep=True).sum())
+    return frame, {
+        "digest": digest,
+        "source": source,
+        "raw_bytes": raw_bytes,
+        "bytes": optimized,
+        "saved_bytes": raw_bytes - optimized,
+        "saved_pct": (raw_bytes - optimized) / raw_bytes * 100 if raw_bytes else 0.0,
+        "seconds": time.perf_counter() - start
+    }
@@ -0,0 +1,131 @@
+"""Timers and counters for the matching hot paths.
+
+Stage timers (`timer`, `timed`) wrap whole stages such as parsing, theme
+scoring or top-k selection. They are always on and cost about a microsecond
+per stage. The per-pair scalar helpers (score_*, calculate_score) run far
+too often for that, so they are only wrapped while detailed timing is on
+(`instrument`), and then only one call in `sample_every` is timed; the
+others are just counted. Stats are process-wide.
+"""
+import functools
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+_timers = {}     # name -> [calls, timed calls, seconds, max seconds]
+_counters = {}
+_originals = {}  # (module, attribute) -> function replaced by instrument()
+
+def _stat(name):
+    stat = _timers.get(name)
+    if stat is None:
+        stat = _timers[name] = [0, 0, 0.0, 0.0]
+    return stat
+
+def _record(stat, seconds):
+    stat[0] += 1
+    stat[1] += 1
+    stat[2] += seconds
+    if seconds > stat[3]:
+        stat[3] = seconds
+
+@contextmanager
+def timer(name):
+    """Time the enclosed block under name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(_stat(name), time.perf_counter() - start)
+
+def timed(name=None):
+    """Decorator form of timer; the name defaults to the function's."""
+    def wrap(fn):
+        stat = _stat(name or fn.__name__)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _record(stat, time.perf_counter() - start)
+        return wrapper
+    return wrap
+
+def count(name, n=1):
+    _counters[name] = _counters.get(name, 0) + n
+
+def _sampled(fn, stat, sample_every):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if stat[0] % sample_every:
+            stat[0] += 1
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            stat[0] += 1
+            stat[1] += 1
+            stat[2] += seconds
+            stat[3] = max(stat[3], seconds)
+    return wrapper
+
+def instrument(module, names, sample_every=1):
+    """Replace module.<name> for each name with a sampled, timed wrapper.
+
+    Callers that look the function up in the module (as calculate_score does
+    for the score_* helpers) go through the wrapper. Calling it again
+    re-wraps with the new sample rate.
+    """
+    for name in names:
+        original = _originals.setdefault((module, name), getattr(module, name))
+        setattr(module, name, _sampled(original, _stat(name), max(1, int(sample_every))))
+
+def uninstrument():
+    """Put back every function replaced by instrument()."""
+    for (module, name), original in _originals.items():
+        setattr(module, name, original)
+    _originals.clear()
+
+def instrumented():
+    return bool(_originals)
+
+def reset():
+    """Zero all stats (wrappers keep their slots)."""
+    for stat in _timers.values():
+        stat[:] = [0, 0, 0.0, 0.0]
+    _counters.clear()
+
+def snapshot():
+    """Stats recorded since the last reset, as plain JSON-ready dicts.
+
+    estimated_s scales the timed calls up to all calls, which only differs
+    from seconds for sampled functions.
+    """
+    timers = {}
+    for name, (calls, n_timed, seconds, max_s) in _timers.items():
+        if calls:
+            timers[name] = {
+                "calls": calls,
+                "timed": n_timed,
+                "seconds": seconds,
+                "estimated_s": seconds * calls / n_timed if n_timed else 0.0,
+                "mean_ms": seconds / n_timed * 1000 if n_timed else 0.0,
+                "max_ms": max_s * 1000
+            }
+    return {"timers": timers, "counters": dict(_counters)}
+
+def profile_dump(profiler):
+    """A cProfile.Profile's stats in the pstats file format, as bytes."""
+    fd, path = tempfile.mkstemp(suffix=".prof")
+    os.close(fd)
+    try:
+        profiler.dump_stats(path)
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
@@ -0,0 +1,104 @@
+"""Synthetic clients, maids and pair files that follow the upload schema.
+
+Values are drawn from the category domains the score_* helpers branch on,
+including "+"-joined strings and values no branch handles, so every branch
+(and every neutral fallback) is exercised. "+"-joined fields only use tokens
+from the matching.MASK_FIELDS vocabularies, since ingestion rejects others. `skew` concentrates draws on the
+first values of each domain: 0 is uniform, larger is more lopsided, which is
+closer to real uploads where most clients leave fields unspecified.
+"""
+import numpy as np
+import pandas as pd
+
+from matching import CLIENT_COLUMNS, MAID_COLUMNS
+
+# -------------------------------
+# DOMAINS
+# -------------------------------
+CLIENT_DOMAINS = {
+    "clientmts_household_type": ["unspecified", "baby", "many_kids", "baby_and_kids", "other"],
+    "clientmts_special_cases": ["unspecified", "elderly", "special_needs", "elderly_and_special", "other"],
+    "clientmts_pet_type": ["unspecified", "cat", "dog", "both", "other"],
+    "clientmts_dayoff_policy": ["unspecified", "fixed_sunday", "flexible"],
+    "clientmts_nationality_preference": [
+        "any", "filipina", "ethiopian maid", "west african nationality", "indian",
+        "filipina+ethiopian maid", "ethiopian maid + west african nationality",
+        "filipina+west african nationality", "filipina+ethiopian maid+west african nationality"
+    ],
+    "clientmts_living_arrangement": [
+        "unspecified", "private_room", "live_out+private_room",
+        "private_room+abu_dhabi", "live_out+private_room+abu_dhabi", "live_out", "abu_dhabi"
+    ],
+    "clientmts_cuisine_preference": [
+        "unspecified", "lebanese", "khaleeji", "international",
+        "lebanese+khaleeji", "lebanese+international", "khaleeji+international",
+        "lebanese+khaleeji+international", "khaleeji+lebanese", "international+lebanese+khaleeji"
+    ]
+}
+
+MAID_DOMAINS = {
+    "maid_grouped_nationality": ["filipina", "ethiopian", "west_african", "indian", "other"],
+    "maidmts_household_type": ["unspecified", "refuses_baby", "refuses_many_kids", "refuses_baby_and_kids"],
+    "maidmts_pet_type": ["unspecified", "refuses_cat", "refuses_dog", "refuses_both_pets"],
+    "maidmts_dayoff_policy": ["unspecified", "refuses_fixed_sunday"],
+    "maidmts_living_arrangement": [
+        "unspecified", "refuses_abu_dhabi", "refuses_live_out", "refuses_live_out+refuses_abu_dhabi"
+    ],
+    "maidpref_education": ["unspecified", "school", "university", "both"],
+    "maidpref_kids_experience": ["unspecified", "lessthan2", "above2", "both"],
+    "maidpref_pet_handling": ["unspecified", "cats", "dogs", "both"],
+    "maidpref_personality": ["unspecified", "calm", "energetic", "calm+energetic"],
+    "maidpref_travel": ["unspecified", "travel", "relocate", "travel_and_relocate"],
+    "maidpref_smoking": ["unspecified", "non_smoker", "smoker"],
+    "maidpref_caregiving_profile": ["unspecified", "elderly_experienced", "special_needs", "elderly_and_special"]
+}
+
+MAID_FLAGS = [
+    "maidspeaks_amharic", "maidspeaks_arabic", "maidspeaks_english", "maidspeaks_french",
+    "maidspeaks_oromo", "maid_cooking_khaleeji", "maid_cooking_lebanese",
+    "maid_cooking_international", "maid_cooking_not_specified"
+]
+
+MAX_EXPERIENCE = 15
+
+# -------------------------------
+# GENERATORS
+# -------------------------------
+
+def _draw(rng, values, n, skew):
+    # Zipf-like weights over the domain order; skew=0 is uniform
+    weights = 1.0 / np.arange(1, len(values) + 1) ** skew
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=n, p=weights / weights.sum())]
+
+def make_clients(n, skew=0.0, seed=0):
+    """n clients with CLIENT_COLUMNS, named client_0 ... client_{n-1}."""
+    rng = np.random.default_rng(seed)
+    clients = pd.DataFrame({"client_name": [f"client_{i}" for i in range(n)]})
+    for column, values in CLIENT_DOMAINS.items():
+        clients[column] = _draw(rng, values, n, skew)
+    return clients[CLIENT_COLUMNS]
+
+def make_maids(n, skew=0.0, seed=0, flag_rate=0.4):
+    """n maids with MAID_COLUMNS, ids maid_0 ... maid_{n-1}; flags are 1 with probability flag_rate."""
+    rng = np.random.default_rng(seed + 1)
+    maids = pd.DataFrame({"maid_id": [f"maid_{i}" for i in range(n)]})
+    maids["years_of_experience"] = _draw(rng, list(range(MAX_EXPERIENCE + 1)), n, skew).astype(np.int64)
+    for column in MAID_FLAGS:
+        maids[column] = (rng.random(n) < flag_rate).astype(np.int64)
+    for column, values in MAID_DOMAINS.items():
+        maids[column] = _draw(rng, values, n, skew)
+    return maids[MAID_COLUMNS]
+
+def make_pairs(clients_df, maids_df, n, seed=0):
+    """A Tab 1 style pair file: n random (client, maid) rows with both sides' columns."""
+    rng = np.random.default_rng(seed + 2)
+    return pd.concat([
+        clients_df.iloc[rng.integers(len(clients_df), size=n)].reset_index(drop=True),
+        maids_df.iloc[rng.integers(len(maids_df), size=n)].reset_index(drop=True)
+    ], axis=1)
+
+def make_dataset(n_clients, n_maids, n_pairs, skew=0.0, seed=0):
+    """(clients, maids, pairs) frames for one benchmark scale."""
+    clients = make_clients(n_clients, skew, seed)
+    maids = make_maids(n_maids, skew, seed)
+    return clients, maids, make_pairs(clients, maids, n_pairs, seed)